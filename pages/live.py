@@ -1,25 +1,56 @@
 import os
+import threading
 import time
-from base64 import b64encode
-from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import TYPE_CHECKING, Optional
 
-import pandas as pd
 import streamlit as st
 from camera_input_live import camera_input_live
 from logzero import logger
-from simplesingletable import DynamoDbMemory
-from supersullytools.llm.agent import AgentStates, ChatAgent
-from supersullytools.llm.completions import CompletionHandler, ImagePromptMessage
-from supersullytools.llm.trackers import (
-    CompletionTracker,
-    DailyUsageTracking,
-    GlobalUsageTracker,
-    SessionUsageTracking,
-    UsageStats,
+
+from thevoid.admission import BusyError, Priority, llm_priority
+from thevoid.agent_runner import AgentRunner
+from thevoid.hedging import Hedger
+from thevoid.mirror import (
+    build_agent,
+    compact_history,
+    get_agent,
+    get_agent_pool,
+    get_agent_runner,
+    get_agent_utils,
+    get_audio,
+    get_budget,
+    get_description_cache,
+    get_photo_description,
+    get_vision_hedger,
+    prepare_photo,
+    reset_guest,
+    run_agent,
+    seed_agent,
+    stop_busy,
+    warm_up,
+)
+from thevoid.presence import (
+    ACTIVE_CAPTURE,
+    IDLE_CAPTURE,
+    CaptureController,
+    PresenceDetector,
+    Speculation,
+    frame_hash,
+)
+from thevoid.vision import (
+    DescriptionCache,
+    PreparedImage,
+    describe_photo_cached,
+    hash_distance,
 )
-from gtts import gTTS
-from io import BytesIO
-from supersullytools.streamlit.chat_agent_utils import ChatAgentUtils, SlashCmd
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+
+# describe a guest as soon as they are standing still in frame, before they press the button
+SPECULATE = os.environ.get("LIVE_SPECULATE", "1") == "1"
 
 st.set_page_config(layout="wide", initial_sidebar_state="collapsed")
 hide_streamlit_style = """
@@ -62,101 +93,112 @@ st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
 
 @st.cache_resource
-def get_memory() -> DynamoDbMemory:
-    return DynamoDbMemory(logger=logger, table_name=os.environ.get("DYNAMODB_TABLE"))
-
-
-# @st.cache_resource
-def get_completion_handler() -> CompletionHandler:
-    memory = get_memory()
-    trackers = get_trackers()
-    completion_tracker = CompletionTracker(memory=memory, trackers=list(trackers))
-
-    return CompletionHandler(
-        logger=logger,
-        debug_output_prompt_and_response=False,
-        completion_tracker=completion_tracker,
-    )
-
-
-@st.cache_resource
-def get_session_usage_tracker() -> SessionUsageTracking:
-    return SessionUsageTracking()
-
-
-def get_total_cost(tracker: "UsageStats"):
-    stats_df = pd.DataFrame(
-        {
-            "count": tracker.completions_by_model,
-            "input_tokens": tracker.input_tokens_by_model,
-            "cached_input_tokens": tracker.cached_input_tokens_by_model,
-            "output_tokens": tracker.output_tokens_by_model,
-            "cost": tracker.compute_cost_per_model(),
-        }
-    )
-    if not stats_df["count"].count():
-        total_cost = 0.0
-    else:
-        total_cost = round(stats_df["cost"].sum(), 4)
-    return float(total_cost)
-
-
-def get_trackers() -> (
-    tuple[GlobalUsageTracker, DailyUsageTracking, SessionUsageTracking]
-):
-    memory = get_memory()
-    global_tracker = GlobalUsageTracker.ensure_exists(memory)
-    todays_tracker = DailyUsageTracking.get_for_today(memory)
-    if (total_cost := get_total_cost(todays_tracker)) > 0.1:
-        todays_tracker.render_completion_cost_as_expander()
-        logger.error(
-            f"Cost has exceeded daily limit, halting session -- try again tomorrow! {total_cost=}"
+def get_speculation_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculate")
+
+
+def _speculate(
+    agent: "ChatAgent",
+    prepared: PreparedImage,
+    cache: DescriptionCache,
+    hedger: Hedger,
+    runner: AgentRunner,
+    cancelled: threading.Event,
+) -> str:
+    # runs off the script thread, so everything it needs is passed in rather than looked up; it
+    # only gets LLM calls that would otherwise go unused, so it is the first work turned away
+    with llm_priority(Priority.SPECULATIVE):
+        description = describe_photo_cached(cache, hedger, agent, prepared)
+        if cancelled.is_set():
+            return description
+        seed_agent(agent, description)
+        if cancelled.is_set():
+            return description
+        runner.submit(agent).wait()
+    return description
+
+
+def get_presence_detector() -> PresenceDetector:
+    if "presence" not in st.session_state:
+        st.session_state.presence = PresenceDetector(
+            stable_frames=int(os.environ.get("LIVE_STABLE_FRAMES", 3)),
+            presence_distance=int(os.environ.get("LIVE_PRESENCE_DISTANCE", 32)),
         )
-        st.error("Sorry, daily usage limit has been hit")
-        st.stop()
-
-    logger.debug(f"Total current cost {total_cost=}")
-    return global_tracker, todays_tracker, get_session_usage_tracker()
-
-
-@st.cache_resource
-def get_agent() -> ChatAgent:
-    # tool_profiles = {"all": [] + get_ddg_tools()}
-    return ChatAgent(
-        agent_description=(
-            "You are playing the role of a magic mirror at a party; deliver a clever / witty response to the user "
-            'as they chat with you. The "sessions" will always start with the famouse catch phrase. It is very important'
-            "to keep your responses short, as they are being converted into sound via TTS and the experience is made "
-            "worse if the responses are too long and take a while to beging playing. Similarly do not use markdown or "
-            "fancy formatting in your responses, respond conversationally. Be playful, sassy, whip-smart!"
-        ),
-        logger=logger,
-        completion_handler=get_completion_handler(),
-        # tool_profiles=,
-    )
-
-
-def get_photo_description(image) -> str:
-    msg = (
-        "You are part of a magic mirror AI system at a party; a user has just stepped up to "
-        'your physical device and pressed the button to initiate a new "session"; provide a brief '
-        "description of the user in the attached photo which will be given to the magic mirror chatbot AI "
-        "as it chats with the user in the role of a magic mirror. Do not try to read text on shirts or things like "
-        "that, you are bad at it and it often steers the interaction into a poor conversation. Do make your description "
-        "as detailed as possible, noting where possible the style of haircut, if they are stylish, etc. "
-        "Any specific and notable details that can be used by the chatbot greatly enhance the user experience!"
+    return st.session_state.presence
+
+
+def get_capture_controller() -> CaptureController:
+    if "capture" not in st.session_state:
+        st.session_state.capture = CaptureController(
+            idle=replace(
+                IDLE_CAPTURE,
+                debounce=int(os.environ.get("LIVE_IDLE_DEBOUNCE_MS", IDLE_CAPTURE.debounce)),
+            ),
+            active=replace(
+                ACTIVE_CAPTURE,
+                debounce=int(os.environ.get("LIVE_ACTIVE_DEBOUNCE_MS", ACTIVE_CAPTURE.debounce)),
+            ),
+            idle_after_seconds=float(os.environ.get("LIVE_IDLE_AFTER_SECONDS", 20)),
+        )
+    return st.session_state.capture
+
+
+def speculate(frame, phash: int):
+    # called once a guest holds still in front of the mirror; their photo is described and the
+    # first reply generated in the background, so the button just picks it up
+    if "speculation" not in st.session_state:
+        st.session_state.speculation = None
+        st.session_state.last_guest_phash = None
+
+    # anyone within the hint distance is taken to be the same guest
+    same_guest = get_description_cache().hint_distance
+    if (
+        st.session_state.last_guest_phash is not None
+        and hash_distance(st.session_state.last_guest_phash, phash) <= same_guest
+    ):
+        return
+    if (speculation := st.session_state.speculation) is not None:
+        if speculation.matches(phash, same_guest):
+            return
+        speculation.cancel()
+
+    logger.info("Guest is holding still in frame; describing them ahead of the button")
+    agent = build_agent()
+    cancelled = threading.Event()
+    future = get_speculation_executor().submit(
+        _speculate,
+        agent,
+        prepare_photo(frame),
+        get_description_cache(),
+        get_vision_hedger(),
+        get_agent_runner(),
+        cancelled,
     )
-    agent = get_agent()
-    completion = agent.get_simple_completion(
-        msg=ImagePromptMessage(
-            content=msg,
-            images=[b64encode(image.getvalue()).decode()],
-            image_formats=["png"],
-        ),
-        # trying out Claude 3 Haiku, gpt-4o-mini
-        model=agent.completion_handler.get_model_by_name_or_id("Claude 3 Haiku"),
+    st.session_state.speculation = Speculation(phash=phash, agent=agent, future=future, cancelled=cancelled)
+
+
+def adopt_speculation(image) -> Optional[str]:
+    # returns the photo description if a speculative run for this guest could be taken over
+    speculation: Optional[Speculation] = st.session_state.get("speculation")
+    st.session_state.speculation = None
+    if speculation is None:
+        return None
+    phash = frame_hash(image.getvalue())
+    if not speculation.matches(phash, get_description_cache().hint_distance):
+        speculation.cancel()
+        return None
+    try:
+        with st.spinner("Asking the mirror..."):
+            image_description = speculation.future.result()
+    except Exception:
+        logger.warning("Speculative description failed, describing the photo again", exc_info=True)
+        return None
+    logger.info(
+        f"Adopted speculative description started {time.monotonic() - speculation.started:.1f}s ago"
     )
-    return completion.content
+    get_agent_pool().put(st.session_state.agent_session_key_id, speculation.agent)
+    st.session_state.last_guest_phash = phash
+    return image_description
 
 
 @st.fragment()
@@ -166,35 +208,41 @@ def camera_display():
 
 @st.fragment()
 def camera():
-    return camera_input_live(show_controls=False)
+    capture = get_capture_controller()
+    settings = capture.settings()
+    frame = camera_input_live(
+        debounce=settings.debounce,
+        width=settings.width,
+        height=settings.height,
+        key="live_camera",
+        show_controls=False,
+    )
+    # reruns for other reasons hand back the previous frame again; only new frames are processed
+    if frame is None or (fingerprint := hash(frame.getvalue())) == st.session_state.get("last_frame"):
+        return frame
+    st.session_state.last_frame = fingerprint
+
+    started = time.perf_counter()
+    try:
+        phash = frame_hash(frame.getvalue())
+        present = get_presence_detector().observe(phash)
+        # speculation spends money on guests who may never press the button; not worth it near the cap
+        if SPECULATE and present and not get_budget().over_soft_limit:
+            speculate(frame, phash)
+    except Exception:
+        # frame processing is only ever an optimization; never let it break the live feed
+        logger.exception("Failed processing live camera frame")
+    else:
+        capture.record(phash, time.perf_counter() - started, present)
+        if not capture.frames % 100:
+            logger.info(f"Live camera {capture.stats()}")
+    return frame
 
 
 def main():
+    warm_up()
     st.sidebar.subheader("Magic Mirror")
 
-    def _agent():
-        agent = get_agent()
-        return agent
-
-    agent = _agent()
-
-    def _display_usage():
-        for tracker in get_trackers():
-            st.write(tracker.__class__.__name__)
-            tracker.render_completion_cost_as_expander()
-
-    agent_utils = ChatAgentUtils(
-        agent,
-        use_system_slash_cmds=False,
-        extra_slash_cmds={
-            "/usage": SlashCmd(
-                name="Show Usage",
-                mechanism=_display_usage,
-                description="Display LLM Usage",
-            )
-        },
-    )
-
     if "image_key" not in st.session_state:
         st.session_state.image_key = 1
         st.session_state.upload_images = []
@@ -213,54 +261,65 @@ def main():
         image = None
 
     if st.session_state.cam_input:
+        from supersullytools.streamlit.chat_agent_utils import SlashCmd
+
+        # the agent (and the mirror's heavier imports) are only needed once there's a guest
+        agent = get_agent()
+        agent_utils = get_agent_utils(
+            agent,
+            extra_slash_cmds={
+                "/camera": SlashCmd(
+                    name="Show Camera",
+                    mechanism=lambda: get_capture_controller().stats(),
+                    description="Display live camera frame rate and processing time",
+                ),
+            },
+        )
+
         st.sidebar.image(st.session_state.cam_input)
         st.sidebar.write(
             "#### ✨ Mirror, mirror on the wall, who's the fairest of them all? 🌟"
         )
         if agent.working:
-            with st.spinner("The mirror is thinking..."):
-                while agent.working:
-                    agent.run_agent()
-                    time.sleep(0.05)
+            # a guest mid-conversation is served ahead of new guests and the Void page
+            with st.spinner("The mirror is thinking..."), llm_priority(Priority.CONVERSATION):
+                if not run_agent(agent):
+                    stop_busy(st.sidebar)
 
         def gch():
-            return _agent().get_chat_history(True, False)
+            return get_agent().get_chat_history(True, False)
 
         if not gch():
+            # so the guest isn't mistaken for the empty room, should they have been in view from the start
+            get_presence_detector().subject_seen(frame_hash(st.session_state.cam_input.getvalue()))
+            if (image_description := adopt_speculation(st.session_state.cam_input)) is not None:
+                st.session_state.image_description = image_description
+                st.rerun()
             with st.spinner("Asking the mirror..."):
-                image_description = get_photo_description(st.session_state.cam_input)
+                try:
+                    image_description = get_photo_description(st.session_state.cam_input)
+                except BusyError:
+                    logger.warning("LLM calls are backed up, photo description not admitted")
+                    stop_busy(st.sidebar)
                 st.session_state.image_description = image_description
-                agent.force_add_chat_msg(
-                    msg=(
-                        "User description follows, respond as if the user had said to you "
-                        '"Mirror mirror on the wall, who\'s the fairest of them all"\n\n'
-                        f"<user_description>{image_description}</user_description>"
-                    ),
-                    role="system",
-                )
-                agent.current_state = AgentStates.received_message
-                while agent.working:
-                    agent.run_agent()
-                    time.sleep(0.05)
+                seed_agent(agent, image_description)
+                if not run_agent(agent):
+                    stop_busy(st.sidebar)
                 st.rerun()
 
         if chat_history := gch():
-
-            def _reset():
-                st.session_state.cam_input = None
-                get_agent.clear()
-
             st.sidebar.caption(st.session_state.image_description)
 
             st.sidebar.button(
                 "Reset",
-                on_click=_reset,
+                on_click=reset_guest,
                 use_container_width=True,
             )
 
             st.sidebar.write(chat_history[-1].content)
-            audio_file = get_audio(chat_history[-1].content)
-            st.sidebar.audio(audio_file, autoplay=True)
+            audio, audio_format = get_audio(chat_history[-1].content)
+            if audio is not None:
+                st.sidebar.audio(audio, format=audio_format, autoplay=True)
 
             if chat_msg := st.chat_input("Talk to the mirror"):
                 if agent_utils.add_user_message(
@@ -276,6 +335,9 @@ def main():
                     time.sleep(0.01)
                     st.rerun()
 
+            # summarized in the background, between turns; see compact_history
+            compact_history(agent)
+
     else:
         if st.button(
             "✨ Mirror, mirror on the wall, who's the fairest of them all? 🌟",
@@ -286,14 +348,5 @@ def main():
             st.rerun()
 
 
-@st.cache_data
-def get_audio(text: str):
-    sound_file = BytesIO()
-    # text = text.replace(", ", "")
-    tts = gTTS(text, lang="en")
-    tts.write_to_fp(sound_file)
-    return sound_file
-
-
 if __name__ == "__main__":
     main()
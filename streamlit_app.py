@@ -1,13 +1,62 @@
-import random
-import re
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
-import openai
+from logzero import logger
+
+from thevoid.admission import BusyError, get_admission_controller
+from thevoid.cache import TTLCache
+from thevoid.llm import LLMClient
+from thevoid.mirror import get_usage_accumulator
+from thevoid.void import (
+    abstract_cache_key,
+    choose_response_type,
+    empathic_cache_key,
+    get_abstract,
+    is_svg,
+    stream_empathic,
+)
+from thevoid.warmup import get_warmup
 
 st.set_page_config(initial_sidebar_state="collapsed")
 
-SVG_R = r"(?:<\?xml\b[^>]*>[^<]*)?(?:<!--.*?-->[^<]*)*(?:<svg|<!DOCTYPE svg)\b"
-SVG_RE = re.compile(SVG_R, re.DOTALL)
+# when enabled, the abstract response is requested alongside the empathic one instead of after it
+PARALLEL_ABSTRACT = os.environ.get("VOID_PARALLEL_ABSTRACT", "1") != "0"
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="void")
+
+
+@st.cache_resource(show_spinner=False)
+def get_llm_client() -> LLMClient:
+    return LLMClient(
+        timeout_seconds=float(os.environ.get("VOID_LLM_TIMEOUT", 30)),
+        max_retries=int(os.environ.get("VOID_LLM_MAX_RETRIES", 2)),
+        # counted in the same daily and global trackers as the mirror, and toward the same budget
+        on_usage=lambda model, usage: get_usage_accumulator().track_openai_usage(model, usage),
+    )
+
+
+@st.cache_resource
+def get_response_cache() -> TTLCache:
+    return TTLCache(
+        max_entries=int(os.environ.get("VOID_CACHE_SIZE", 512)),
+        ttl_seconds=float(os.environ.get("VOID_CACHE_TTL", 3600)),
+        persist_dir=os.environ.get("VOID_CACHE_DIR"),
+        name="void responses",
+    )
+
+
+# connects and loads the usage trackers in the background, so the first submission doesn't pay for
+# the TLS handshake or the DynamoDB reads
+get_warmup().register(
+    {
+        "void llm": lambda: get_llm_client().warm(),
+        "usage trackers": lambda: get_usage_accumulator().refresh(),
+    }
+)
 
 st.header("To the void...")
 form = st.form("to the void", border=False)
@@ -16,86 +65,53 @@ user_input = form.text_area(
 )
 if form.form_submit_button("cast your words"):
     if user_input.strip() != "":
-        with st.spinner("into the void..."):
-            response_type = random.choice(
-                [
-                    "A single word in ALL CAPS representing the mood.",
-                    "A single word in ALL CAPS representing the mood.",
-                    "A simple poem.",
-                    "A simple haiku.",
-                    'An SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, with some animation perhaps; do not include backticks or other markdown elements around the svg output).',
-                    'An SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, do not include backticks or other markdown elements around the svg output).',
-                    'An abstract SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, do not include backticks or other markdown elements around the svg output).',
-                    "ASCII art reflecting the emotion.",
-                    # "A color or color palette (provide hex codes) symbolizing the mood.",
-                    "A brief metaphorical statement capturing the essence of the feelings.",
-                    "A brief story or anecdote mirroring the emotions.",
-                    "A sequence of emojis representing the user's feelings.",
-                    "A sequence of emojis representing the user's feelings.",
-                    "A sequence of emojis representing the user's feelings.",
-                    # "An abstract mathematical expression related to the emotions.",
-                    "A suggestion for a mindfulness or breathing exercise.",
-                    "A completely freeform response of your choosing.",
-                ]
-            )
-            prompt = f"""
-            You are a compassionate and understanding listener. A user is venting their feelings:
-
-            "{user_input}"
-
-            Provide a CONCISE but empathetic and supportive response. Never offer advice or try to solve the problem.
-            """.strip()
-
-            # Call the OpenAI API
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=150,
-                n=1,
-                temperature=0.7,
-            )
-
-            empathic = response.choices[0].message.content.strip()
-            st.header("From the void...")
-            st.write(empathic)
-
-            make_abstract = f"""
-You are THE VOID. An Abstract Feelings AI.
-
-A user is venting their feelings
-
-<input>
-{user_input}
-</input>
-
-And empathic response has been generated and displayed to the user already:
-
-<empathic_response>
-{empathic}
-</empathic_response>
-
-Generate a new, small, abstract response that carries a similar sentiment.
-
-For this response, please generate a response of the following type:
-{response_type}
-
-Do not include any titles or headers. Output only the response.
-""".strip()
-
-            response2 = openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": make_abstract}],
-                max_completion_tokens=1000,
-                n=1,
-                temperature=1,
-            )
-            abstract = response2.choices[0].message.content.strip()
-
-            st.divider()
-            is_svg = SVG_RE.match(abstract) is not None
-            if is_svg:
-                st.image(abstract)
-            else:
-                st.caption(abstract)
+        try:
+            with st.spinner("into the void..."):
+                response_type = choose_response_type()
+                cache = get_response_cache()
+                abstract = cache.get(abstract_cache_key(user_input, response_type))
+                empathic = cache.get(empathic_cache_key(user_input))
+
+                abstract_future = None
+                if abstract is None and PARALLEL_ABSTRACT:
+                    # fire off the abstract request now; unless the empathic response is cached, it
+                    # hasn't been generated yet, so the abstract works from the user input alone
+                    abstract_future = get_executor().submit(
+                        get_abstract, get_llm_client(), user_input, response_type, empathic
+                    )
+
+                st.header("From the void...")
+                if empathic is not None:
+                    st.write(empathic)
+                else:
+                    # Call the OpenAI API, streaming the response onto the page as it is generated
+                    empathic = st.write_stream(
+                        stream_empathic(get_llm_client(), user_input)
+                    )
+                    empathic = empathic.strip()
+                    cache.set(empathic_cache_key(user_input), empathic)
+
+                if abstract is None:
+                    if abstract_future is not None:
+                        abstract = abstract_future.result()
+                    else:
+                        abstract = get_abstract(
+                            get_llm_client(), user_input, response_type, empathic
+                        )
+                    if response_type.is_valid(abstract):
+                        cache.set(abstract_cache_key(user_input, response_type), abstract)
+                logger.debug(f"Void response cache {cache.stats()}")
+                logger.debug(f"Void LLM client {get_llm_client().stats()}")
+                logger.debug(f"LLM admission {get_admission_controller().stats()}")
+
+                st.divider()
+                if is_svg(abstract):
+                    st.image(abstract)
+                else:
+                    st.caption(abstract)
+        except BusyError:
+            # too many calls already queued; better to say so now than to keep the guest waiting
+            logger.warning("LLM calls are backed up, turning away a Void submission")
+            st.warning("The void is busy right now; please try again in a moment.")
     else:
         st.write("Please enter some text before submitting.")
@@ -20,3 +20,38 @@ def compile_requirements(c, upgrade=False):
     with Paths.cd(c, Paths.repo_root):
         upgrade_flag = "--upgrade" if upgrade else ""
         c.run(f"pip-compile --resolver=backtracking -v {upgrade_flag} -o requirements.txt")
+
+
+@task
+def bench(c, target="all", profile="typical", iterations=20, turns=3, json=None, production_limits=False):
+    """Benchmark the Void page and scripted mirror sessions against stub services (no API calls)."""
+    with Paths.cd(c, Paths.repo_root):
+        json_flag = f"--json {json}" if json else ""
+        limits_flag = "--production-limits" if production_limits else ""
+        c.run(
+            f"python -m thevoid.bench {target} --profile {profile} --iterations {iterations} --turns {turns} "
+            f"{json_flag} {limits_flag}"
+        )
+
+
+@task
+def stub_server(c, profile="typical", port=8765):
+    """Serve stub OpenAI / Bedrock endpoints, for running the app itself offline."""
+    with Paths.cd(c, Paths.repo_root):
+        c.run(f"python -m thevoid.stubs --profile {profile} --port {port}", pty=True)
+
+
+@task
+def load(c, pages="void,mirror,live", levels="1,2,4,8,16", duration=30, profile="typical", json=None):
+    """Ramp up concurrent headless sessions against stub services to find where one process saturates."""
+    with Paths.cd(c, Paths.repo_root):
+        json_flag = f"--json {json}" if json else ""
+        c.run(f"python -m thevoid.load --pages {pages} --levels {levels} --duration {duration} --profile {profile} {json_flag}")
+
+
+@task
+def cold_start(c, pages="void,mirror,live", json=None):
+    """Time each page's first render in a fresh process, and the imports it spends that time on."""
+    with Paths.cd(c, Paths.repo_root):
+        json_flag = f"--json {json}" if json else ""
+        c.run(f"python -m thevoid.coldstart {pages} {json_flag}")
@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import cache
+from typing import Iterator, Optional
+
+from logzero import logger
+
+from thevoid.metrics import LatencyRecorder
+
+
+class Priority(IntEnum):
+    # lower goes first
+    CONVERSATION = 0
+    DEFAULT = 1
+    SPECULATIVE = 2
+
+
+# the priority LLM calls made from the current context are admitted at; worker pools that make calls on
+# someone's behalf (AgentRunner, Hedger) run their tasks in a copy of the submitting context
+CURRENT_PRIORITY: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.DEFAULT)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    token = CURRENT_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        CURRENT_PRIORITY.reset(token)
+
+
+class BusyError(RuntimeError):
+    """Raised instead of queueing an LLM call when too many are already waiting."""
+
+
+class AdmissionController(object):
+    """Process-wide gate in front of every LLM call.
+
+    At most `max_concurrency` calls are in flight, and new calls start no faster than `rate_per_second`
+    (a token bucket holding up to `burst` tokens). Waiting calls are admitted by priority, then in arrival
+    order. A call that would have to queue behind `max_queue` others fails fast with BusyError, as does
+    any speculative call that can't start right away, and so does one still waiting after
+    `queue_timeout_seconds`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        rate_per_second: float = 5,
+        burst: int = 10,
+        max_queue: int = 32,
+        queue_timeout_seconds: float = 30,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_depth = 0
+        self.waits = LatencyRecorder()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, priority: Optional[Priority] = None) -> Iterator[None]:
+        self._acquire(CURRENT_PRIORITY.get() if priority is None else priority)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiting),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_seconds": self.waits.stats(),
+            }
+
+    def reset_stats(self):
+        # the counters and waits start over; calls in flight and queued are unaffected
+        with self._cond:
+            self.admitted = self.rejected = self.timed_out = 0
+            self.max_queue_depth = len(self._waiting)
+            self.waits = LatencyRecorder()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+
+    def _can_start(self) -> bool:
+        self._refill()
+        return self.in_flight < self.max_concurrency and self._tokens >= 1
+
+    def _acquire(self, priority: Priority):
+        started = time.monotonic()
+        deadline = started + self.queue_timeout_seconds
+        with self._cond:
+            if self._waiting or not self._can_start():
+                if priority >= Priority.SPECULATIVE or len(self._waiting) >= self.max_queue:
+                    self.rejected += 1
+                    raise BusyError(f"The void is busy ({len(self._waiting)} calls waiting)")
+            ticket = (int(priority), next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            while not (self._waiting[0] == ticket and self._can_start()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self.timed_out += 1
+                    self._cond.notify_all()
+                    raise BusyError(f"The void is busy (waited {self.queue_timeout_seconds}s for a slot)")
+                # with a free slot, the wait is only for the bucket to refill
+                wait = (1 - self._tokens) / self.rate_per_second if self.in_flight < self.max_concurrency else remaining
+                self._cond.wait(max(0.001, min(wait, remaining)))
+            heapq.heappop(self._waiting)
+            self._tokens -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            self._cond.notify_all()
+        waited = time.monotonic() - started
+        self.waits.record(priority.name.lower(), waited)
+        if waited > 1:
+            logger.info(f"LLM call admitted after {waited:.2f}s priority={priority.name}")
+
+
+@cache
+def get_admission_controller() -> AdmissionController:
+    # a single instance for the whole process, so the Void and mirror pages share the same limits
+    return AdmissionController(
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)),
+        rate_per_second=float(os.environ.get("LLM_RATE_PER_SECOND", 5)),
+        burst=int(os.environ.get("LLM_BURST", 10)),
+        max_queue=int(os.environ.get("LLM_MAX_QUEUE", 32)),
+        queue_timeout_seconds=float(os.environ.get("LLM_QUEUE_TIMEOUT", 30)),
+    )
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional
+
+from logzero import logger
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+
+
+class AgentPool(object):
+    """One ChatAgent per browser session, bounded by an idle timeout and a hard cap on live agents."""
+
+    def __init__(self, max_agents: int = 32, idle_ttl_seconds: float = 900):
+        self.max_agents = max_agents
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.spares_used = 0
+        # built ahead of time (see Warmup), and handed to the next new session instead of calling its factory
+        self.spare: Optional["ChatAgent"] = None
+        # session id -> (last used, agent), least recently used first
+        self._agents: OrderedDict[str, tuple[float, "ChatAgent"]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, factory: Callable[[], "ChatAgent"]) -> "ChatAgent":
+        with self._lock:
+            self._evict_idle()
+            if (agent := self._take(session_id)) is not None:
+                self._insert(session_id, agent)
+                return agent
+        # built outside the lock, like the spare, so other sessions aren't held up by it
+        logger.info(f"Creating agent for session {session_id=}")
+        built = factory()
+        with self._lock:
+            self.created += 1
+            # another run of the same session may have beaten us to it; the first agent in wins
+            agent = self._take(session_id) or built
+            self._insert(session_id, agent)
+            return agent
+
+    def _take(self, session_id: str) -> Optional["ChatAgent"]:
+        # the session's own agent, or else the spare; None when a new one has to be built
+        if session_id in self._agents:
+            _, agent = self._agents.pop(session_id)
+            return agent
+        if self.spare is not None:
+            logger.info(f"Handing the spare agent to session {session_id=}")
+            agent, self.spare = self.spare, None
+            self.spares_used += 1
+            return agent
+        return None
+
+    def put(self, session_id: str, agent: "ChatAgent"):
+        # hands a session an agent built elsewhere, e.g. one seeded ahead of time
+        with self._lock:
+            self._agents.pop(session_id, None)
+            self._insert(session_id, agent)
+
+    def ensure_spare(self, factory: Callable[[], "ChatAgent"]):
+        # built outside the lock, so sessions aren't held up by it
+        if self.spare is None:
+            agent = factory()
+            with self._lock:
+                self.spare = self.spare or agent
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._agents.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._agents
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict_idle()
+            agents = [agent for _, agent in self._agents.values()]
+            now = time.monotonic()
+            oldest_idle = max((now - used for used, _ in self._agents.values()), default=0.0)
+        return {
+            "live_agents": len(agents),
+            "max_agents": self.max_agents,
+            "occupancy": round(len(agents) / self.max_agents, 3) if self.max_agents else 0.0,
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "spares_used": self.spares_used,
+            "oldest_idle_seconds": round(oldest_idle, 1),
+            "history_messages": sum(len(x.chat_history) for x in agents),
+            # rough stand-in for memory held by the pool; the chat history text dominates an agent's footprint
+            "history_chars": sum(len(msg.content) for x in agents for msg in x.chat_history),
+        }
+
+    def _insert(self, session_id: str, agent: "ChatAgent"):
+        self._agents[session_id] = (time.monotonic(), agent)
+        while len(self._agents) > self.max_agents:
+            evicted_id, _ = self._agents.popitem(last=False)
+            self.evicted_lru += 1
+            logger.info(f"Agent pool full, evicting least recently used session {evicted_id=}")
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._agents:
+            session_id, (last_used, _) = next(iter(self._agents.items()))
+            if last_used > cutoff:
+                break
+            del self._agents[session_id]
+            self.evicted_idle += 1
+            logger.info(f"Evicting idle agent {session_id=}")
@@ -0,0 +1,124 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from logzero import logger
+
+from thevoid.metrics import get_metrics
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+
+
+class AgentRun(object):
+    """Drives an agent on a background thread until it stops working."""
+
+    def __init__(self, agent: "ChatAgent"):
+        self.agent = agent
+        self.future: Future = Future()
+        self._cond = threading.Condition()
+        self._status: Optional[str] = None
+        self._version = 0
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    def publish(self, status: str):
+        with self._cond:
+            self._status = status
+            self._version += 1
+            self._cond.notify_all()
+
+    def iter_updates(self, timeout: Optional[float] = None) -> Iterator[str]:
+        # yields the agent status after every step and returns once the agent is idle; updates are
+        # broadcast rather than queued, so a rerun that attaches to an in-flight run can't miss the end
+        seen = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._version != seen or self.done, timeout=timeout):
+                    raise TimeoutError("Timed out waiting on agent")
+                status, seen = self._status, self._version
+            if status is not None and seen:
+                yield status
+            if self.done and seen == self._version:
+                break
+        self.future.result()
+
+    def wait(self, timeout: Optional[float] = None):
+        return self.future.result(timeout=timeout)
+
+    def _drive(self, after: Optional[Future] = None):
+        try:
+            if after is not None:
+                # upkeep queued between turns (see AgentRunner.run_between_turns) has to finish first
+                wait([after])
+            while self.agent.working:
+                with get_metrics().span("agent step"):
+                    self.agent.run_agent()
+                self.publish(self.agent.get_current_status_msg())
+        except BaseException as e:
+            logger.exception("Agent run failed")
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(self.agent)
+        finally:
+            with self._cond:
+                self._cond.notify_all()
+
+
+class AgentRunner(object):
+    """Drives ChatAgents on a worker pool instead of polling them from the script thread."""
+
+    def __init__(self, max_workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent")
+        self._runs: dict[int, AgentRun] = {}
+        self._between_turns: dict[int, Future] = {}
+        # reentrant, since cancelling upkeep from submit runs its done callback right there
+        self._lock = threading.RLock()
+
+    def submit(self, agent: "ChatAgent") -> AgentRun:
+        # an agent only ever has a single active run; submitting again (e.g. from a rerun) attaches to it
+        with self._lock:
+            if (run := self._runs.get(id(agent))) is None:
+                run = AgentRun(agent)
+                self._runs[id(agent)] = run
+                run.future.add_done_callback(lambda _: self._finished(agent))
+                # upkeep that hasn't started yet is dropped rather than waited on
+                if (upkeep := self._between_turns.get(id(agent))) is not None and upkeep.cancel():
+                    upkeep = None
+                # the run keeps the submitter's context (e.g. its LLM call priority)
+                self._executor.submit(contextvars.copy_context().run, run._drive, upkeep)
+            return run
+
+    def run_between_turns(self, agent: "ChatAgent", fn: Callable[[], object]):
+        # for upkeep on an idle agent (e.g. compacting its history) that nobody should wait on; it runs on
+        # the pool, and the agent's next turn waits for it only if it has already started; skipped while
+        # the agent is running or has upkeep queued already
+        with self._lock:
+            if id(agent) in self._runs or id(agent) in self._between_turns:
+                return
+            future = self._executor.submit(contextvars.copy_context().run, self._run_upkeep, fn)
+            self._between_turns[id(agent)] = future
+        future.add_done_callback(lambda _: self._upkeep_finished(agent, future))
+
+    def active_runs(self) -> int:
+        with self._lock:
+            return len(self._runs)
+
+    def _finished(self, agent: "ChatAgent"):
+        with self._lock:
+            self._runs.pop(id(agent), None)
+
+    @staticmethod
+    def _run_upkeep(fn: Callable[[], object]):
+        try:
+            fn()
+        except Exception:
+            logger.exception("Between-turns agent upkeep failed")
+
+    def _upkeep_finished(self, agent: "ChatAgent", future: Future):
+        with self._lock:
+            if self._between_turns.get(id(agent)) is future:
+                del self._between_turns[id(agent)]
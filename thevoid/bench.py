@@ -0,0 +1,377 @@
+"""Offline latency benchmark: runs the Void page and scripted mirror / live sessions through Streamlit's AppTest
+against the stub services in `thevoid.stubs`, and reports p50 / p95 / p99 per stage and end to end.
+
+    python -m thevoid.bench all --profile typical --iterations 20
+
+(or `invoke bench`). Numbers are only comparable between runs on the same machine and profile; save
+them with `--json` to compare a change against its baseline.
+"""
+
+import argparse
+import functools
+import io
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import camera_input_live
+import logzero
+import simplesingletable
+from logzero import logger
+from PIL import Image, ImageDraw
+
+import thevoid.mirror
+import thevoid.vision
+import thevoid.void
+from thevoid.admission import AdmissionController, get_admission_controller
+from thevoid.context import ConversationContext
+from thevoid.metrics import LatencyRecorder
+from thevoid.stubs import PROFILES, Profile, StubLLMServer, StubMemory, StubTTSEngine, stub_env
+from thevoid.tts import SentenceTTS
+from thevoid.warmup import get_warmup
+
+REPO_ROOT = Path(__file__).parent.parent
+VOID_PAGE = REPO_ROOT / "streamlit_app.py"
+MIRROR_PAGE = REPO_ROOT / "pages" / "mirror.py"
+LIVE_PAGE = REPO_ROOT / "pages" / "live.py"
+# high enough that no call is ever queued or turned away; `--production-limits` keeps the app's own
+LOOSE_ADMISSION_ENV = {
+    "LLM_MAX_CONCURRENCY": "1000",
+    "LLM_RATE_PER_SECOND": "100000",
+    "LLM_BURST": "100000",
+    "LLM_MAX_QUEUE": "1000",
+}
+
+VOID_INPUTS = [
+    "My landlord raised the rent again and I don't know how we're going to manage",
+    "I finally finished the project I've been dreading for months",
+    "Nobody remembered my birthday this year",
+    "I'm nervous about the interview tomorrow",
+    "The dog is sick and the vet bills keep piling up",
+]
+MIRROR_SCRIPT = [
+    "Am I the fairest of them all?",
+    "What do you think of my outfit?",
+    "Tell me a secret about this party.",
+    "Any advice for the dance floor?",
+]
+
+
+class StageTimer(object):
+    """Collects timings for named stages, both measured directly and by wrapping the app's functions."""
+
+    def __init__(self):
+        self.latencies = LatencyRecorder(window=100_000)
+        self.failures: dict[str, int] = {}
+        self._patches: list[tuple[object, str, object]] = []
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            raise
+        self.latencies.record(name, time.perf_counter() - started)
+
+    def patch(self, owner: object, attr: str, value: object):
+        self._patches.append((owner, attr, getattr(owner, attr)))
+        setattr(owner, attr, value)
+
+    def wrap(self, owner: object, attr: str, name: str):
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            with self.measure(name):
+                return original(*args, **kwargs)
+
+        self.patch(owner, attr, timed)
+
+    def wrap_stream(self, owner: object, attr: str, name: str):
+        # for functions returning an iterator; times the first item as well as the whole stream
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            first = True
+            with self.measure(name):
+                for item in original(*args, **kwargs):
+                    if first:
+                        self.latencies.record(f"{name} first token", time.perf_counter() - started)
+                        first = False
+                    yield item
+
+        self.patch(owner, attr, timed)
+
+    def restore(self):
+        while self._patches:
+            owner, attr, original = self._patches.pop()
+            setattr(owner, attr, original)
+
+    def reset(self):
+        # starts a fresh set of timings; the wrapped functions stay wrapped
+        self.latencies = LatencyRecorder(window=100_000)
+        self.failures = {}
+
+    def stats(self) -> dict[str, dict]:
+        return self.latencies.stats()
+
+
+@contextmanager
+def bench_environment(
+    profile: Profile, timer: StageTimer, production_limits: bool = False
+) -> Iterator[StubLLMServer]:
+    # everything the pages reach for is pointed at the stubs, and the process-wide singletons are
+    # cleared so they get rebuilt against them
+    import streamlit as st
+    from supersullytools.llm.agent import ChatAgent
+
+    server = StubLLMServer(profile).start()
+    env = {
+        **stub_env(server.url),
+        # the spend is all pretend, and the cheaper over-budget mode would skew the numbers
+        "BUDGET_DAILY_LIMIT": "1000",
+        # warming up in the background would compete with the sessions being timed
+        "WARMUP": "0",
+    }
+    if not production_limits:
+        # otherwise the numbers mostly measure the token bucket, and speculative calls it turns away
+        # show up as failures
+        env.update(LOOSE_ADMISSION_ENV)
+    # and nothing is read back from an earlier run's caches
+    unset = ["VOID_CACHE_DIR", "TTS_CACHE_DIR", "TTS_PREWARM_PHRASES"]
+    saved_env = {name: os.environ.get(name) for name in [*env, *unset]}
+    os.environ.update(env)
+    for name in unset:
+        os.environ.pop(name, None)
+    StubTTSEngine.seconds_per_char = profile.tts_seconds_per_char
+    StubMemory.latency_seconds = profile.dynamodb_seconds
+    timer.patch(simplesingletable, "DynamoDbMemory", StubMemory)
+    timer.patch(thevoid.vision, "VISION_MODELS", env["VISION_MODELS"].split(","))
+    timer.patch(camera_input_live, "camera_input_live", stub_camera_input_live)
+
+    timer.wrap(AdmissionController, "_acquire", "llm admission wait")
+    timer.wrap_stream(thevoid.void, "stream_empathic", "void empathic")
+    timer.wrap(thevoid.void, "get_abstract", "void abstract")
+    timer.wrap(thevoid.vision, "describe_photo_cached", "photo description")
+    timer.wrap(thevoid.mirror, "describe_photo_cached", "photo description")
+    timer.wrap(ChatAgent, "run_agent", "agent step")
+    timer.wrap(SentenceTTS, "synthesize", "tts")
+    timer.wrap(ConversationContext, "compact", "compaction")
+    timer.wrap(StubMemory, "get_existing", "dynamodb get")
+    timer.wrap(StubMemory, "increment_counter", "dynamodb increment")
+    timer.wrap(StubMemory, "_put_nonversioned_resource", "dynamodb put")
+
+    st.cache_resource.clear()
+    get_admission_controller.cache_clear()
+    get_warmup.cache_clear()
+    try:
+        yield server
+    finally:
+        timer.restore()
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        st.cache_resource.clear()
+        get_admission_controller.cache_clear()
+        get_warmup.cache_clear()
+        server.stop()
+
+
+class PageError(RuntimeError):
+    """The page under test raised, or never got to the expected output; counted as a failure."""
+
+
+def new_app(page: Path, app_class: Optional[type] = None):
+    from streamlit.testing.v1 import AppTest
+
+    return (app_class or AppTest)(str(page), default_timeout=300)
+
+
+def check_page(at):
+    if at.exception:
+        raise PageError(f"Page raised: {at.exception[0].message}")
+
+
+def run_until(at, done: Callable[[], bool], max_runs: int = 10):
+    # the pages st.rerun() between steps; keep rerunning until the expected output shows up
+    for _ in range(max_runs):
+        check_page(at)
+        if done():
+            return
+        at.run()
+    raise PageError(f"Page did not finish in {max_runs} runs")
+
+
+def last_reply(at, sidebar: bool = False) -> Optional[str]:
+    markdown = at.sidebar.markdown if sidebar else at.markdown
+    return markdown[-1].value if markdown else None
+
+
+def guest_photo(seed: int, size: tuple[int, int] = (640, 480), quality: int = 85) -> bytes:
+    # a different made-up "guest" for every seed, so photo descriptions aren't served from the cache
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(40, 240), rng.randrange(40, 240)
+        draw.ellipse((x, y, x + w, y + h), fill=tuple(rng.randrange(256) for _ in range(3)))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def empty_scene(quality: int = 85, size: tuple[int, int] = (640, 480)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (90, 90, 100)).save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def stub_camera_input_live(**kwargs):
+    # stands in for the live camera component; the driver puts the next frame in the session state
+    import streamlit as st
+
+    frame = st.session_state.get("bench_frame")
+    return io.BytesIO(frame) if frame is not None else None
+
+
+def void_submission(at, timer: StageTimer, idx: int):
+    # one submission on a Void page that has already been run once
+    # (unique text every time, so neither response comes from the cache)
+    at.text_area[0].input(f"{VOID_INPUTS[idx % len(VOID_INPUTS)]} ({idx})")
+    with timer.measure("void end to end"):
+        at.button[0].click().run()
+        check_page(at)
+
+
+def _chat(at, timer: StageTimer, name: str, turns: int, sidebar: bool = False):
+    for turn in range(turns):
+        msg = MIRROR_SCRIPT[turn % len(MIRROR_SCRIPT)]
+        before = last_reply(at, sidebar)
+        with timer.measure(name):
+            at.chat_input[0].set_value(msg).run()
+            run_until(at, lambda: last_reply(at, sidebar) not in (before, msg))
+
+
+def mirror_guest(at, timer: StageTimer, idx: int, turns: int):
+    # one guest on a fresh mirror page: the photo, the mirror's first reply, then `turns` chat turns
+    at.session_state.cam_input = io.BytesIO(guest_photo(idx))
+    with timer.measure("mirror first reply"):
+        run_until(at, lambda: bool(at.chat_input))
+    _chat(at, timer, "mirror turn", turns)
+
+
+def live_guest(at, timer: StageTimer, idx: int, turns: int):
+    # one guest on a fresh live page: a few frames of the empty scene, the guest holding still long
+    # enough to be described ahead of time, the button, then `turns` chat turns; every frame is
+    # encoded a little differently, as a real camera's would be
+    frames = [empty_scene(80 + n) for n in range(3)] + [guest_photo(idx, quality=80 + n) for n in range(4)]
+    for frame in frames:
+        at.session_state.bench_frame = frame
+        with timer.measure("live frame"):
+            at.run()
+            check_page(at)
+    if not (buttons := [x for x in at.button if x.label.startswith("✨")]):
+        raise PageError("Live page has no mirror button")
+    button = buttons[0]
+    with timer.measure("live first reply"):
+        button.click().run()
+        run_until(at, lambda: bool(at.chat_input))
+    _chat(at, timer, "live turn", turns, sidebar=True)
+
+
+def bench_void(timer: StageTimer, iterations: int):
+    at = new_app(VOID_PAGE)
+    at.run()
+    check_page(at)
+    for idx in range(iterations):
+        try:
+            void_submission(at, timer, idx)
+        except PageError as e:
+            logger.warning(f"Void submission {idx} failed: {e}")
+
+
+def bench_guests(timer: StageTimer, page: Path, guest: Callable, iterations: int, turns: int, first: int = 0):
+    for idx in range(first, first + iterations):
+        # every iteration is a new guest in a new session
+        at = new_app(page)
+        at.run()
+        try:
+            check_page(at)
+            guest(at, timer, idx, turns)
+        except PageError as e:
+            # the rest of this guest's session is skipped
+            logger.warning(f"Guest {idx} on {page.name} failed: {e}")
+
+
+def report(stats: dict[str, dict], failures: dict[str, int], requests: dict[str, int]) -> str:
+    lines = [f"{'stage':<34}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for name in sorted(stats):
+        row = stats[name]
+        lines.append(
+            f"{name:<34}{row['count']:>7}"
+            + "".join(f"{row[pct] * 1000:>10.0f}" for pct in ("p50", "p95", "p99"))
+        )
+    if failures:
+        lines.append(f"failures: {json.dumps(failures)}")
+    lines.append(f"stub requests: {json.dumps(requests)}")
+    return "\n".join(lines)
+
+
+def run(target: str, profile: Profile, iterations: int, turns: int, production_limits: bool = False) -> dict:
+    timer = StageTimer()
+    with bench_environment(profile, timer, production_limits) as server:
+        if target in ("void", "all"):
+            bench_void(timer, iterations)
+        if target in ("mirror", "all"):
+            bench_guests(timer, MIRROR_PAGE, mirror_guest, iterations, turns)
+        if target in ("live", "all"):
+            # new faces, so the live page doesn't reuse the mirror page's descriptions
+            bench_guests(timer, LIVE_PAGE, live_guest, iterations, turns, first=iterations)
+        requests = server.stats()
+    return {"stages": timer.stats(), "failures": timer.failures, "requests": requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Void and mirror pages against stub services")
+    parser.add_argument("target", nargs="?", default="all", choices=["void", "mirror", "live", "all"])
+    parser.add_argument("--profile", default="typical", choices=sorted(PROFILES))
+    parser.add_argument("--iterations", type=int, default=20, help="Void submissions / guests per mirror page")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per mirror guest after the first reply")
+    parser.add_argument("--ttft", type=float, help="override the profile's seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, help="override the profile's token rate")
+    parser.add_argument("--error-rate", type=float, help="override the profile's fraction of failed calls")
+    parser.add_argument(
+        "--production-limits", action="store_true", help="keep the app's LLM admission limits instead of lifting them"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's info logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logzero.loglevel(logging.WARNING)
+    profile = PROFILES[args.profile]
+    overrides = {"ttft_seconds": args.ttft, "tokens_per_second": args.tokens_per_second, "error_rate": args.error_rate}
+    profile = replace(profile, **{k: v for k, v in overrides.items() if v is not None})
+
+    results = run(args.target, profile, args.iterations, args.turns, args.production_limits)
+    print(f"profile {args.profile}: {profile}")
+    print(report(results["stages"], results["failures"], results["requests"]))
+    if args.json:
+        Path(args.json).write_text(json.dumps({"profile": args.profile, **asdict(profile), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from supersullytools.llm.completions import CompletionModel, CompletionResponse
+    from supersullytools.llm.trackers import UsageStats
+
+
+def completion_cost(model: "CompletionModel", completion: "CompletionResponse") -> float:
+    # same arithmetic as UsageStats.compute_cost_per_model, for a single completion; unlike
+    # CompletionResponse.completion_cost it isn't rounded, so many small completions still add up
+    input_tokens = completion.input_tokens
+    cached_input_tokens = completion.cached_input_tokens or 0
+    if cached_input_tokens and model.cached_input_price_per_1k:
+        input_cost = (input_tokens - cached_input_tokens) / 1000 * model.input_price_per_1k
+        input_cost += cached_input_tokens / 1000 * model.cached_input_price_per_1k
+    else:
+        input_cost = input_tokens / 1000 * model.input_price_per_1k
+    return input_cost + completion.output_tokens / 1000 * model.output_price_per_1k
+
+
+def total_cost(stats: "UsageStats") -> float:
+    return float(sum(stats.compute_cost_per_model().values()))
+
+
+class BudgetGuard(object):
+    """Running total of the day's spend, checked against a soft and a hard limit.
+
+    Past the soft limit the mirror keeps going in a cheaper mode (see `over_soft_limit`); past the hard
+    limit it stops serving. The total is seeded from the daily tracker and then kept up to date one
+    completion at a time, so checking it is constant time.
+    """
+
+    def __init__(self, hard_limit: float = 0.10, soft_limit: Optional[float] = None):
+        self.hard_limit = hard_limit
+        self.soft_limit = soft_limit if soft_limit is not None else hard_limit * 0.75
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self, spent: float):
+        with self._lock:
+            self.spent = spent
+
+    def add(self, cost: float):
+        with self._lock:
+            self.spent += cost
+
+    @property
+    def over_soft_limit(self) -> bool:
+        return self.spent > self.soft_limit
+
+    @property
+    def over_hard_limit(self) -> bool:
+        return self.spent > self.hard_limit
+
+    def state(self) -> str:
+        if self.over_hard_limit:
+            return "hard"
+        return "soft" if self.over_soft_limit else "ok"
+
+    def stats(self) -> dict:
+        return {
+            "spent": round(self.spent, 6),
+            "soft_limit": self.soft_limit,
+            "hard_limit": self.hard_limit,
+            "state": self.state(),
+        }
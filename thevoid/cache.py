@@ -0,0 +1,168 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, Optional
+
+from logzero import logger
+
+_MISSING = object()
+
+
+def content_key(*parts: Hashable) -> str:
+    # stable across processes, so it can double as the on-disk file name
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class TTLCache(object):
+    """Thread-safe LRU cache with per-entry expiry and optional on-disk persistence."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: Optional[float] = 3600,
+        persist_dir: Optional[str | Path] = None,
+        name: str = "cache",
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self._prune_disk()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and self._expired(entry[0]):
+                self._pop(key)
+                entry = _MISSING
+            if entry is _MISSING and self.persist_dir:
+                entry = self._read_disk(key)
+                if entry is not _MISSING:
+                    self._put(key, entry)
+                    self._evict()
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        entry = (time.time(), value)
+        with self._lock:
+            self._put(key, entry)
+            self._evict()
+        if self.persist_dir:
+            self._write_disk(key, entry)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            return entry is not _MISSING and not self._expired(entry[0])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+        if self.persist_dir:
+            for path in self.persist_dir.glob("*.pkl"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes if self.max_bytes is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def _put(self, key: str, entry: tuple[float, Any]):
+        self._pop(key)
+        self._entries[key] = entry
+        if self.max_bytes is not None:
+            self.total_bytes += self.sizeof(entry[1])
+
+    def _pop(self, key: str):
+        if (entry := self._entries.pop(key, _MISSING)) is not _MISSING and self.max_bytes is not None:
+            self.total_bytes -= self.sizeof(entry[1])
+
+    def _over_limit(self) -> bool:
+        if len(self._entries) > self.max_entries:
+            return True
+        # always keep the newest entry, even if it is larger than the whole budget on its own
+        return self.max_bytes is not None and self.total_bytes > self.max_bytes and len(self._entries) > 1
+
+    def _evict(self):
+        while self._over_limit():
+            key = next(iter(self._entries))
+            self._pop(key)
+            self.evictions += 1
+            if self.persist_dir:
+                self._path(key).unlink(missing_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.persist_dir / f"{key}.pkl"
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            with path.open("rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception:
+            logger.warning(f"Discarding unreadable {self.name} entry {path}", exc_info=True)
+            path.unlink(missing_ok=True)
+            return _MISSING
+        if self._expired(entry[0]):
+            path.unlink(missing_ok=True)
+            return _MISSING
+        return entry
+
+    def _write_disk(self, key: str, entry: tuple[float, Any]):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            with tmp_path.open("wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.warning(f"Failed persisting {self.name} entry {path}", exc_info=True)
+            tmp_path.unlink(missing_ok=True)
+
+    def _prune_disk(self):
+        # drop anything expired, then the oldest files beyond the size bounds
+        paths = sorted(self.persist_dir.glob("*.pkl"), key=lambda x: x.stat().st_mtime, reverse=True)
+        disk_bytes = 0
+        for idx, path in enumerate(paths):
+            stat = path.stat()
+            disk_bytes += stat.st_size
+            expired = self.ttl_seconds is not None and time.time() - stat.st_mtime > self.ttl_seconds
+            too_big = self.max_bytes is not None and disk_bytes > self.max_bytes
+            if expired or too_big or idx >= self.max_entries:
+                path.unlink(missing_ok=True)
@@ -0,0 +1,115 @@
+"""Cold start profile: how long each page's first render takes in a fresh process, and which imports it
+spends that time on.
+
+    python -m thevoid.coldstart
+
+(or `invoke cold-start`). Every page is rendered once, through Streamlit's AppTest, in its own
+interpreter started with `-X importtime`; Streamlit itself is imported beforehand and not counted,
+since the server has it loaded before any page runs.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# not taken from thevoid.bench, which would have the child import the mirror's dependencies up front
+REPO_ROOT = Path(__file__).parent.parent
+PAGES = {
+    "void": REPO_ROOT / "streamlit_app.py",
+    "mirror": REPO_ROOT / "pages" / "mirror.py",
+    "live": REPO_ROOT / "pages" / "live.py",
+}
+# written to stderr between Streamlit's imports and the page's
+MARKER = "coldstart: rendering"
+
+
+def render(page: Path):
+    # runs in the child process; the render time goes to stdout, the import times to stderr
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(page), default_timeout=60)
+    print(MARKER, file=sys.stderr, flush=True)
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"seconds": elapsed, "exceptions": [x.value for x in at.exception]}))
+
+
+def parse_importtime(stderr: str) -> tuple[float, Counter]:
+    # returns the total seconds spent importing, and each top-level package's share of it
+    _, _, after = stderr.partition(MARKER)
+    total = 0.0
+    by_package = Counter()
+    for line in after.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not name[1:].startswith(" "):
+            # only the outermost imports, so nested ones aren't counted twice
+            total += int(cumulative_us) / 1e6
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return total, by_package
+
+
+def profile_page(page: Path) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "thevoid.coldstart", "--render", str(page)],
+        cwd=REPO_ROOT,
+        # just the render; the warm-up's imports would otherwise land in the middle of it
+        env={**os.environ, "WARMUP": "0"},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"Rendering {page.name} failed:\n{result.stderr[-2000:]}")
+    rendered = json.loads(result.stdout.strip().splitlines()[-1])
+    import_seconds, by_package = parse_importtime(result.stderr)
+    return {
+        "render_seconds": round(rendered["seconds"], 3),
+        "import_seconds": round(import_seconds, 3),
+        "exceptions": rendered["exceptions"],
+        "imports": {name: round(seconds, 3) for name, seconds in by_package.most_common()},
+    }
+
+
+def report(results: dict[str, dict], top: int) -> str:
+    lines = []
+    for name, result in results.items():
+        lines.append(
+            f"{name}: first render {result['render_seconds'] * 1000:.0f} ms, "
+            f"of which imports {result['import_seconds'] * 1000:.0f} ms"
+        )
+        for package, seconds in list(result["imports"].items())[:top]:
+            lines.append(f"    {package:<32}{seconds * 1000:>8.0f} ms")
+        for exception in result["exceptions"]:
+            lines.append(f"    raised: {exception}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each page's first render in a fresh process, by import")
+    parser.add_argument("pages", nargs="?", default="void,mirror,live", help="comma-separated pages to profile")
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest packages to list per page")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--render", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render:
+        render(Path(args.render))
+        return
+    pages = [x.strip() for x in args.pages.split(",") if x.strip()]
+    if unknown := set(pages) - set(PAGES):
+        parser.error(f"unknown pages {sorted(unknown)}; options are {', '.join(PAGES)}")
+    results = {name: profile_page(PAGES[name]) for name in pages}
+    print(report(results, args.top))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from typing import TYPE_CHECKING
+
+from logzero import logger
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+    from supersullytools.llm.trackers import UsageStats
+
+SUMMARY_PROMPT = (
+    "Below is the start of a conversation between a magic mirror at a party and a guest. Summarize it in a "
+    "few sentences for the mirror to remember, keeping the guest's name if given, anything they shared about "
+    "themselves, and any running jokes. Reply with the summary only.\n\n<conversation>{conversation}</conversation>"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly four characters per token for English; close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def cached_input_rate(usage: "UsageStats") -> float:
+    input_tokens = sum(usage.input_tokens_by_model.values())
+    return round(sum(usage.cached_input_tokens_by_model.values()) / input_tokens, 3) if input_tokens else 0.0
+
+
+class ConversationContext(object):
+    """Keeps a mirror agent's chat history inside a token budget, so replies don't slow down as a guest
+    keeps chatting.
+
+    The first `pinned` messages (the guest's photo description) are never touched. Once the history grows
+    past `max_tokens`, everything but the last `keep_recent` messages is folded into a single summary
+    message right after the pinned ones. Compacting in one go rather than trimming a little every turn
+    leaves the prompt prefix unchanged in between, which is what lets provider prompt caching apply.
+    """
+
+    def __init__(self, max_tokens: int = 2000, keep_recent: int = 6, pinned: int = 1, summary_max_tokens: int = 250):
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.pinned = pinned
+        self.summary_max_tokens = summary_max_tokens
+        self.compactions = 0
+
+    def history_tokens(self, agent: "ChatAgent") -> int:
+        return sum(estimate_tokens(x.content) for x in agent.chat_history)
+
+    def compact(self, agent: "ChatAgent") -> bool:
+        # only call this between turns (it may run off the script thread, see AgentRunner.run_between_turns);
+        # returns whether the history was rewritten
+        from supersullytools.llm.completions import PromptMessage
+
+        history = agent.chat_history
+        if agent.working or self.history_tokens(agent) <= self.max_tokens:
+            return False
+        split = len(history) - self.keep_recent
+        # start the kept turns on a guest message, so the mirror never opens with half an exchange
+        while split < len(history) and history[split].role != "user":
+            split += 1
+        older = history[self.pinned : split]
+        if len(older) < 2:
+            return False
+
+        conversation = "\n".join(f"{x.role}: {x.content}" for x in older)
+        completion = agent.completion_handler.get_completion(
+            model=agent.default_completion_model,
+            prompt=[PromptMessage(role="user", content=SUMMARY_PROMPT.format(conversation=conversation))],
+            max_response_tokens=self.summary_max_tokens,
+        )
+        summary = PromptMessage(
+            role="system",
+            content=f"<conversation_summary>{completion.content.strip()}</conversation_summary>",
+        )
+        if agent.chat_history is not history:
+            # the history was replaced while the summary was being written; it no longer applies
+            return False
+        before = self.history_tokens(agent)
+        # anything the guest added meanwhile was appended to `history`, so it is kept
+        agent.chat_history = history[: self.pinned] + [summary] + history[split:]
+        self.compactions += 1
+        logger.info(
+            f"Compacted chat history {len(older)} messages into a summary; "
+            f"tokens {before} -> {self.history_tokens(agent)}"
+        )
+        return True
+
+    def stats(self, agent: "ChatAgent", usage: "UsageStats") -> dict:
+        return {
+            "messages": len(agent.chat_history),
+            "history_tokens": self.history_tokens(agent),
+            "max_tokens": self.max_tokens,
+            "compactions": self.compactions,
+            "cached_input_rate": cached_input_rate(usage),
+        }
@@ -0,0 +1,71 @@
+import contextvars
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional, TypeVar
+
+from logzero import logger
+
+from thevoid.metrics import LatencyRecorder
+
+T = TypeVar("T")
+
+
+class Hedger(object):
+    """Runs a call against a primary and, if it is slow, a secondary backend; the first answer wins."""
+
+    def __init__(self, max_workers: int = 8, window: int = 200):
+        self.latencies = LatencyRecorder(window)
+        self.wins: dict[str, int] = defaultdict(int)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def suggest_delay(self, name: str, pct: float = 95, min_samples: int = 20) -> Optional[float]:
+        # hedging at the primary's p95 means only the slowest ~5% of calls pay for a second request
+        if self.latencies.count(name) < min_samples:
+            return None
+        return self.latencies.percentile(name, pct)
+
+    def call(self, calls: dict[str, Callable[[], T]], delay_seconds: Optional[float]) -> tuple[str, T]:
+        # calls are tried in order; a delay of None disables hedging (only the first is used)
+        # and a delay of 0 sends every call at once
+        names = list(calls)
+        if delay_seconds is None:
+            names = names[:1]
+
+        futures: dict[Future, str] = {}
+        for idx, name in enumerate(names):
+            futures[self._start(name, calls[name])] = name
+            if idx == len(names) - 1:
+                break
+            done, _ = wait(futures, timeout=delay_seconds, return_when=FIRST_COMPLETED)
+            if any(not x.exception() for x in done):
+                break
+            logger.info(f"No answer from {name} after {delay_seconds}s; sending request to {names[idx + 1]}")
+
+        pending = set(futures)
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = futures[future]
+                    self.wins[winner] += 1
+                    for loser in pending:
+                        # a request already in flight can't be recalled; its result is just ignored
+                        loser.cancel()
+                    return winner, future.result()
+                errors.append(future.exception())
+                logger.warning(f"Hedged call {futures[future]} failed: {future.exception()!r}")
+        raise errors[0]
+
+    def _start(self, name: str, fn: Callable[[], T]) -> Future:
+        started = time.perf_counter()
+
+        def _timed():
+            try:
+                return fn()
+            finally:
+                # losers are recorded too; their latency is exactly what tunes the hedge delay
+                self.latencies.record(name, time.perf_counter() - started)
+
+        return self._executor.submit(contextvars.copy_context().run, _timed)
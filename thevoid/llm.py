@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Iterator, Optional
+
+import httpx
+import openai
+from logzero import logger
+
+from thevoid.admission import AdmissionController, get_admission_controller
+
+# errors worth another attempt; anything else (bad request, auth, ...) would just fail again
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMClient(object):
+    """One OpenAI client shared by every session, with pooled keep-alive connections, per-call timeouts,
+    bounded retries with jittered backoff, and usage tracking; calls go through the
+    process-wide AdmissionController. Each completion's usage is also handed to `on_usage`, if given."""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        timeout_seconds: float = 30,
+        connect_timeout_seconds: float = 5,
+        keepalive_seconds: float = 60,
+        max_retries: int = 2,
+        backoff_seconds: float = 0.5,
+        admission: Optional[AdmissionController] = None,
+        on_usage: Optional[Callable[[str, "openai.types.CompletionUsage"], None]] = None,
+    ):
+        self.client = openai.Client(
+            http_client=openai.DefaultHttpxClient(
+                # kept open well past httpx's default of 5s, so the warm-up's connections are still there
+                # for the first guest; see Warmup
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                    keepalive_expiry=keepalive_seconds,
+                ),
+                timeout=httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds),
+            ),
+            # retries are done here instead, so they are jittered and counted
+            max_retries=0,
+        )
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.admission = admission or get_admission_controller()
+        self.on_usage = on_usage
+        # model -> counts, using the same names as the mirror's usage trackers
+        self.usage: dict[str, Counter] = defaultdict(Counter)
+        self.retries = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def warm(self):
+        # listing models costs nothing, and leaves a connection (TLS handshake done) in the pool
+        self.client.models.list()
+
+    def chat(self, model: str, messages: list[dict], **kwargs) -> "openai.types.chat.ChatCompletion":
+        with self.admission.slot():
+            response = self._with_retries(
+                lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+            )
+        self._track(model, response.usage)
+        return response
+
+    def stream_chat(self, model: str, messages: list[dict], **kwargs) -> Iterator[str]:
+        # yields the text deltas; only opening the stream is retried, since a retry after text has
+        # been shown would repeat it
+        with self.admission.slot():
+            stream = self._with_retries(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs,
+                )
+            )
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        self._track(model, chunk.usage)
+                    if chunk.choices and (delta := chunk.choices[0].delta.content):
+                        yield delta
+            finally:
+                stream.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            usage = {model: dict(counts) for model, counts in self.usage.items()}
+        return {
+            "usage": usage,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+    def _with_retries(self, fn):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self.errors += 1
+                    raise
+                # full jitter, so callers that failed together don't all come back at once
+                delay = random.uniform(0, self.backoff_seconds * 2**attempt)
+                logger.warning(f"LLM call failed, retrying in {delay:.2f}s {attempt=} {e!r}")
+                self.retries += 1
+                time.sleep(delay)
+            except Exception:
+                self.errors += 1
+                raise
+
+    def _track(self, model: str, usage: Optional["openai.types.CompletionUsage"]):
+        if usage is None:
+            return
+        cached = usage.prompt_tokens_details.cached_tokens if usage.prompt_tokens_details else 0
+        with self._lock:
+            self.usage[model].update(
+                {
+                    "completions": 1,
+                    "input_tokens": usage.prompt_tokens,
+                    "cached_input_tokens": cached or 0,
+                    "output_tokens": usage.completion_tokens,
+                }
+            )
+        if self.on_usage is not None:
+            try:
+                self.on_usage(model, usage)
+            except Exception:
+                # the response has already been paid for and is on its way; losing the count is the lesser evil
+                logger.warning(f"Failed tracking LLM usage {model=}", exc_info=True)
@@ -0,0 +1,294 @@
+"""Load generator: many simultaneous headless sessions of the Void, mirror and live pages in one process,
+against the stub services in `thevoid.stubs`, ramped up step by step to find where the process saturates.
+
+    python -m thevoid.load --pages void,mirror,live --levels 1,2,4,8,16 --duration 30
+
+(or `invoke load`). For every concurrency level it reports sessions completed per minute, rerun latency,
+memory per concurrent session and what the LLM admission queue looked like; the saturation point is the
+first level where adding sessions stops adding throughput.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+from itertools import count
+from pathlib import Path
+from typing import Iterator, Optional
+from unittest.mock import MagicMock
+from urllib import parse
+
+import logzero
+from logzero import logger
+from streamlit import source_util
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.pages_manager import PagesManager
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+from streamlit.testing.v1.util import patch_config_options
+
+from thevoid.admission import get_admission_controller
+from thevoid.bench import (
+    LIVE_PAGE,
+    MIRROR_PAGE,
+    VOID_PAGE,
+    PageError,
+    StageTimer,
+    bench_environment,
+    check_page,
+    live_guest,
+    mirror_guest,
+    new_app,
+    void_submission,
+)
+from thevoid.stubs import PROFILES, Profile
+
+PAGES = {"void": VOID_PAGE, "mirror": MIRROR_PAGE, "live": LIVE_PAGE}
+# a level is saturated once each session gets less than this share of the throughput a lone session gets
+SATURATED_EFFICIENCY = 0.7
+
+
+class ConcurrentAppTest(AppTest):
+    """AppTest that can run alongside others in the same process.
+
+    AppTest installs a mock Streamlit runtime around every run and tears it down afterwards, which
+    breaks any other run in progress; this one leaves that to `shared_runtime`, which sets it up once.
+    """
+
+    def _run(self, widget_state=None, timeout: Optional[float] = None) -> "ConcurrentAppTest":
+        script_runner = LocalScriptRunner(
+            self._script_path,
+            self.session_state,
+            PagesManager(self._script_path, setup_watcher=False),
+            args=self.args,
+            kwargs=self.kwargs,
+        )
+        self._tree = script_runner.run(
+            widget_state, self.query_params, timeout or self.default_timeout, self._page_hash
+        )
+        self._tree._runner = self
+        self.query_params = parse.parse_qs(script_runner.event_data[-1]["client_state"].query_string)
+        return self
+
+
+@contextmanager
+def shared_runtime() -> Iterator[None]:
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+
+    # Streamlit caches a single app's page list for the whole process, which would have every page
+    # running as whichever was loaded first; keep one list per main script instead
+    get_pages = source_util.get_pages
+    pages_by_script = {}
+    lock = threading.Lock()
+
+    def get_pages_for(main_script_path: str):
+        with lock:
+            if main_script_path not in pages_by_script:
+                source_util.invalidate_pages_cache()
+                pages_by_script[main_script_path] = get_pages(main_script_path)
+            return pages_by_script[main_script_path]
+
+    Runtime._instance = runtime
+    source_util.get_pages = get_pages_for
+    try:
+        with patch_config_options({"global.appTest": True}):
+            yield
+    finally:
+        source_util.get_pages = get_pages
+        source_util.invalidate_pages_cache()
+        Runtime._instance = None
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # outside Linux this is the peak rather than the current size (in bytes on macOS, KiB elsewhere)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class MemorySampler(object):
+    """Samples the process's resident memory in the background, keeping the peak."""
+
+    def __init__(self, interval_seconds: float = 0.25):
+        self.interval_seconds = interval_seconds
+        self.peak = rss_mb()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_seconds):
+            self.peak = max(self.peak, rss_mb())
+
+
+def _session(page: str, timer: StageTimer, seed: int, turns: int):
+    at = new_app(PAGES[page], ConcurrentAppTest)
+    at.run()
+    check_page(at)
+    if page == "void":
+        for idx in range(turns + 1):
+            void_submission(at, timer, seed * 100 + idx)
+    elif page == "mirror":
+        mirror_guest(at, timer, seed, turns)
+    else:
+        live_guest(at, timer, seed, turns)
+
+
+def run_level(timer: StageTimer, pages: list[str], concurrency: int, duration_seconds: float, turns: int, seeds: count) -> dict:
+    # `concurrency` workers each run back-to-back sessions, taking turns through `pages`, until time is
+    # up; sessions in progress at the deadline are allowed to finish
+    timer.reset()
+    deadline = time.monotonic() + duration_seconds
+    completed = {page: 0 for page in pages}
+    failed = {page: 0 for page in pages}
+    lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < deadline:
+            seed = next(seeds)
+            page = pages[seed % len(pages)]
+            try:
+                with timer.measure(f"{page} session"):
+                    _session(page, timer, seed, turns)
+            except PageError as e:
+                logger.warning(f"{page} session failed: {e}")
+                with lock:
+                    failed[page] += 1
+            else:
+                with lock:
+                    completed[page] += 1
+
+    baseline = rss_mb()
+    started = time.monotonic()
+    with MemorySampler() as memory, ThreadPoolExecutor(concurrency, thread_name_prefix="load") as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.monotonic() - started
+
+    stats = timer.stats()
+    admission = get_admission_controller().stats()
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 1),
+        "completed": completed,
+        "failed": failed,
+        "sessions_per_minute": round(sum(completed.values()) / elapsed * 60, 2),
+        "rerun": stats.get("rerun", {}),
+        "peak_rss_mb": round(memory.peak, 1),
+        "mb_per_session": round(max(0.0, memory.peak - baseline) / concurrency, 2),
+        "max_llm_queue_depth": admission["max_queue_depth"],
+        "llm_wait": admission["wait_seconds"],
+        "stages": stats,
+    }
+
+
+def saturation_point(levels: list[dict]) -> Optional[int]:
+    # the first level where sessions fail, or each one gets markedly less done than a lone session would
+    if not levels or not levels[0]["sessions_per_minute"]:
+        return None
+    single = levels[0]["sessions_per_minute"] / levels[0]["concurrency"]
+    for level in levels:
+        efficiency = level["sessions_per_minute"] / (level["concurrency"] * single)
+        if sum(level["failed"].values()) or efficiency < SATURATED_EFFICIENCY:
+            return level["concurrency"]
+    return None
+
+
+def report(levels: list[dict]) -> str:
+    lines = [
+        f"{'sessions':>8}{'done':>7}{'failed':>8}{'per min':>9}{'rerun p50':>11}{'p95':>7}{'p99':>7}"
+        f"{'MB/sess':>9}{'peak MB':>9}{'LLM queue':>11}"
+    ]
+    for level in levels:
+        rerun = level["rerun"] or {"p50": 0, "p95": 0, "p99": 0}
+        lines.append(
+            f"{level['concurrency']:>8}{sum(level['completed'].values()):>7}{sum(level['failed'].values()):>8}"
+            f"{level['sessions_per_minute']:>9.1f}"
+            + "".join(f"{rerun[pct] * 1000:>{width}.0f}" for pct, width in (("p50", 11), ("p95", 7), ("p99", 7)))
+            + f"{level['mb_per_session']:>9.1f}{level['peak_rss_mb']:>9.0f}{level['max_llm_queue_depth']:>11}"
+        )
+    saturated = saturation_point(levels)
+    if saturated is None:
+        lines.append("not saturated at any level tested")
+    else:
+        lines.append(f"saturated at {saturated} concurrent sessions")
+    return "\n".join(lines)
+
+
+def run(pages: list[str], levels: list[int], duration_seconds: float, turns: int, profile: Profile) -> list[dict]:
+    timer = StageTimer()
+    results = []
+    seeds = count()
+    # the admission queue is part of what's being measured here
+    with bench_environment(profile, timer, production_limits=True), shared_runtime():
+        timer.wrap(ConcurrentAppTest, "_run", "rerun")
+        # one untimed session per page first, so imports and process-wide caches don't count against
+        # the first level
+        for page in pages:
+            try:
+                _session(page, timer, next(seeds), turns)
+            except PageError as e:
+                logger.warning(f"Warm-up {page} session failed: {e}")
+        for concurrency in levels:
+            # so the queue stats are the level's own
+            get_admission_controller().reset_stats()
+            results.append(run_level(timer, pages, concurrency, duration_seconds, turns, seeds))
+            logger.warning(f"Load level done {json.dumps({k: v for k, v in results[-1].items() if k != 'stages'})}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp concurrent headless sessions against stub services")
+    parser.add_argument("--pages", default="void,mirror,live", help="comma-separated pages to spread sessions over")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrent session counts")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to hold each level")
+    parser.add_argument("--turns", type=int, default=2, help="chat turns per guest (extra submissions per Void session)")
+    parser.add_argument("--profile", default="typical", choices=sorted(PROFILES))
+    parser.add_argument("--ttft", type=float, help="override the profile's seconds to first token")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's info logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logzero.loglevel(logging.WARNING)
+    pages = [x.strip() for x in args.pages.split(",") if x.strip()]
+    if unknown := set(pages) - set(PAGES):
+        parser.error(f"unknown pages {sorted(unknown)}; options are {', '.join(PAGES)}")
+    levels = [int(x) for x in args.levels.split(",")]
+    profile = PROFILES[args.profile]
+    if args.ttft is not None:
+        profile = replace(profile, ttft_seconds=args.ttft)
+
+    results = run(pages, levels, args.duration, args.turns, profile)
+    print(f"pages {', '.join(pages)}; profile {args.profile}; {args.duration:g}s per level")
+    print(report(results))
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"pages": pages, "profile": args.profile, "levels": results, "saturated_at": saturation_point(results)}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
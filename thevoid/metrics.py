@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional, TypeVar
+
+from logzero import logger
+
+T = TypeVar("T")
+
+# upper bounds, in seconds; wide enough for a TTS chunk at one end and a slow vision call at the other
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class LatencyRecorder(object):
+    """Sliding window of recent call latencies, per name, with exact percentiles; for code that acts on
+    how calls have been going lately (hedge delays, admission waits), where Metrics keeps the whole history."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def percentile(self, name: str, pct: float) -> Optional[float]:
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        return percentile(values, pct)
+
+    def count(self, name: str) -> int:
+        return len(self._samples.get(name, ()))
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            samples = {k: list(v) for k, v in self._samples.items()}
+        return {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+            }
+            for name, values in samples.items()
+            if values
+        }
+
+
+class Histogram(object):
+    """Counts of observations per bucket, plus their sum; percentiles are estimated from the buckets."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # the last slot is the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        # the upper bound of the bucket the percentile falls in (or the largest observation, past the last)
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            **{f"p{pct}": round(value, 3) if (value := self.percentile(pct)) is not None else None for pct in (50, 95, 99)},
+            "max": round(self.max, 3),
+            "errors": self.errors,
+        }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics(object):
+    """Process-wide timings for the app's hot paths, kept as one histogram per stage.
+
+    Time a block with `span`, or an iterator (a streamed response) with `stream`; `render` gives the
+    Prometheus text format, which `serve` exposes over http. Gauge functions added with `add_gauges`
+    are read at render time.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "thevoid"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self._histograms: dict[str, Histogram] = {}
+        self._gauges: list[tuple[str, Callable[[], dict[str, float]]]] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            if (histogram := self._histograms.get(stage)) is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, error)
+
+    def stream(self, stage: str, iterator: Iterator[T]) -> Iterator[T]:
+        # times the whole stream, and separately how long until its first item
+        started = time.perf_counter()
+        first = True
+        with self.span(stage):
+            for item in iterator:
+                if first:
+                    self.observe(f"{stage} first token", time.perf_counter() - started)
+                    first = False
+                yield item
+
+    def add_gauges(self, name: str, fn: Callable[[], dict[str, float]]):
+        self._gauges.append((name, fn))
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {stage: histogram.stats() for stage, histogram in sorted(self._histograms.items())}
+
+    def render(self) -> str:
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of serving a page.",
+            f"# TYPE {name} histogram",
+        ]
+        errors = [
+            f"# HELP {self.prefix}_stage_errors_total Stage runs that raised.",
+            f"# TYPE {self.prefix}_stage_errors_total counter",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                label = f'stage="{_label(stage)}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{label}}} {histogram.count}")
+                errors.append(f"{self.prefix}_stage_errors_total{{{label}}} {histogram.errors}")
+        lines.extend(errors)
+        for gauge_prefix, fn in self._gauges:
+            try:
+                values = fn()
+            except Exception:
+                logger.warning(f"Failed reading {gauge_prefix} gauges", exc_info=True)
+                continue
+            for key, value in values.items():
+                gauge = f"{self.prefix}_{gauge_prefix}_{key}"
+                lines.extend([f"# TYPE {gauge} gauge", f"{gauge} {value}"])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> bool:
+        # serves render() at /metrics from a background thread; returns whether the port could be bound
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"metrics {self.address_string()} {format % args}")
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            # e.g. another process on this host already serves them
+            logger.warning(f"Could not serve metrics on {host}:{port}", exc_info=True)
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return True
+
+
+@cache
+def get_metrics() -> Metrics:
+    # a single instance for the whole process, shared by every page and session
+    # (imported here since the admission controller times its waits with LatencyRecorder)
+    from thevoid.admission import get_admission_controller
+
+    metrics = Metrics()
+    metrics.add_gauges(
+        "llm",
+        lambda: {k: v for k, v in get_admission_controller().stats().items() if k in ("in_flight", "queue_depth")},
+    )
+    if port := os.environ.get("METRICS_PORT"):
+        metrics.serve(int(port), os.environ.get("METRICS_HOST", "0.0.0.0"))
+    return metrics
@@ -0,0 +1,413 @@
+"""What the mirror and live pages share: the agent, its completion handler and usage trackers, photo
+descriptions and speech.
+
+supersullytools, boto3, openai and simplesingletable take a couple of seconds to import between them,
+so they are only imported once a guest needs them; a page can put up its camera before any of that
+is loaded, and the Void page only loads the usage trackers, in its warm-up. `warm_up` has them
+imported, connected and loaded in the background, so the first guest doesn't wait on that either.
+
+The shared resources don't show Streamlit's cache spinner, since the warm-up builds them off the
+script thread, where there's nothing to show it on.
+"""
+
+import os
+from concurrent.futures import wait
+from functools import partial
+from typing import TYPE_CHECKING, Optional
+from uuid import uuid4
+
+import streamlit as st
+from logzero import logger
+
+from thevoid.admission import BusyError, get_admission_controller
+from thevoid.agent_pool import AgentPool
+from thevoid.agent_runner import AgentRunner
+from thevoid.budget import BudgetGuard
+from thevoid.context import ConversationContext
+from thevoid.hedging import Hedger
+from thevoid.metrics import get_metrics
+from thevoid.tts import STOCK_PHRASES, AudioCache, SentenceTTS, get_engine
+from thevoid.vision import DescriptionCache, PreparedImage, describe_photo_cached, prepare_image
+from thevoid.warmup import get_warmup
+
+if TYPE_CHECKING:
+    import openai
+    from simplesingletable import DynamoDbMemory
+    from supersullytools.llm.agent import ChatAgent
+    from supersullytools.llm.completions import CompletionHandler
+    from supersullytools.llm.trackers import DailyUsageTracking, GlobalUsageTracker, SessionUsageTracking
+    from supersullytools.streamlit.chat_agent_utils import ChatAgentUtils, SlashCmd
+
+    from thevoid.usage import UsageAccumulator
+
+AGENT_DESCRIPTION = (
+    "You are playing the role of a magic mirror at a party; deliver a clever / witty response to the user "
+    'as they chat with you. The "sessions" will always start with the famouse catch phrase. It is very important'
+    "to keep your responses short, as they are being converted into sound via TTS and the experience is made "
+    "worse if the responses are too long and take a while to beging playing. Similarly do not use markdown or "
+    "fancy formatting in your responses, respond conversationally. Be playful, sassy, whip-smart!"
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_memory() -> "DynamoDbMemory":
+    from simplesingletable import DynamoDbMemory
+
+    return DynamoDbMemory(logger=logger, table_name=os.environ.get("DYNAMODB_TABLE"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client() -> "openai.Client":
+    # shared by every session, so turns reuse its connection pool rather than each doing a TLS setup;
+    # idle connections are kept for longer than httpx's default 5s, so the warm-up's are still open
+    import httpx
+    import openai
+
+    return openai.Client(
+        http_client=openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=60)
+        )
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_bedrock_client():
+    import boto3
+
+    return boto3.client("bedrock-runtime")
+
+
+def get_completion_handler() -> "CompletionHandler":
+    # the budget is checked on every call, but the handler is built once per session; the trackers
+    # it writes to don't change with the date (UsageAccumulator rolls the daily tracker over itself)
+    from thevoid.usage import AdmittedCompletionHandler, BufferedCompletionTracker
+
+    *_, session_tracker = get_trackers()
+    if "completion_handler" not in st.session_state:
+        st.session_state.completion_handler = AdmittedCompletionHandler(
+            logger=logger,
+            openai_client=get_openai_client(),
+            bedrock_runtime_client=get_bedrock_client(),
+            debug_output_prompt_and_response=False,
+            # the DynamoDB-backed trackers are written behind, in batches; see UsageAccumulator
+            completion_tracker=BufferedCompletionTracker(
+                get_usage_accumulator(), trackers=[session_tracker]
+            ),
+        )
+    return st.session_state.completion_handler
+
+
+def get_session_usage_tracker() -> "SessionUsageTracking":
+    from supersullytools.llm.trackers import SessionUsageTracking
+
+    if "session_usage_tracker" not in st.session_state:
+        st.session_state.session_usage_tracker = SessionUsageTracking()
+    return st.session_state.session_usage_tracker
+
+
+@st.cache_resource(show_spinner=False)
+def get_usage_accumulator() -> "UsageAccumulator":
+    from thevoid.usage import UsageAccumulator
+
+    return UsageAccumulator(
+        memory=get_memory(),
+        flush_interval_seconds=float(os.environ.get("USAGE_FLUSH_SECONDS", 10)),
+        max_pending=int(os.environ.get("USAGE_MAX_PENDING", 20)),
+        budget=BudgetGuard(
+            hard_limit=float(os.environ.get("BUDGET_DAILY_LIMIT", 0.1)),
+            soft_limit=float(os.environ["BUDGET_SOFT_LIMIT"]) if "BUDGET_SOFT_LIMIT" in os.environ else None,
+        ),
+    )
+
+
+def get_budget() -> BudgetGuard:
+    return get_usage_accumulator().budget
+
+
+def apply_budget(agent: "ChatAgent"):
+    # past the soft limit the mirror keeps serving, just with shorter replies
+    if get_budget().over_soft_limit:
+        agent.default_max_response_tokens = int(os.environ.get("BUDGET_SOFT_MAX_TOKENS", 150))
+    else:
+        agent.default_max_response_tokens = 1000
+
+
+def get_trackers() -> (
+    tuple["GlobalUsageTracker", "DailyUsageTracking", "SessionUsageTracking"]
+):
+    with get_metrics().span("trackers"):
+        usage = get_usage_accumulator()
+        global_tracker, todays_tracker = usage.global_tracker, usage.today()
+    total_cost = get_budget().spent
+    if get_budget().over_hard_limit:
+        todays_tracker.render_completion_cost_as_expander()
+        logger.error(
+            f"Cost has exceeded daily limit, halting session -- try again tomorrow! {total_cost=}"
+        )
+        st.error("Sorry, daily usage limit has been hit")
+        st.stop()
+
+    logger.debug(f"Total current cost {total_cost=}")
+    return global_tracker, todays_tracker, get_session_usage_tracker()
+
+
+@st.cache_resource(show_spinner=False)
+def get_agent_pool() -> AgentPool:
+    return AgentPool(
+        max_agents=int(os.environ.get("MIRROR_MAX_AGENTS", 32)),
+        idle_ttl_seconds=float(os.environ.get("MIRROR_AGENT_IDLE_SECONDS", 900)),
+    )
+
+
+def get_agent() -> "ChatAgent":
+    # each screen gets its own agent, so one process can drive several mirrors
+    if "agent_session_key_id" not in st.session_state:
+        st.session_state.agent_session_key_id = uuid4().hex
+    agent = get_agent_pool().get(st.session_state.agent_session_key_id, build_agent)
+    agent.completion_handler = get_completion_handler()
+    apply_budget(agent)
+    return agent
+
+
+def reset_agent():
+    if "agent_session_key_id" in st.session_state:
+        get_agent_pool().discard(st.session_state.agent_session_key_id)
+
+
+def build_agent(completion_handler: Optional["CompletionHandler"] = None) -> "ChatAgent":
+    # tool_profiles = {"all": [] + get_ddg_tools()}
+    from supersullytools.llm.agent import ChatAgent
+
+    logger.info("Loading uncached agent")
+    return ChatAgent(
+        agent_description=AGENT_DESCRIPTION,
+        logger=logger,
+        completion_handler=completion_handler or get_completion_handler(),
+        # tool_profiles=,
+    )
+
+
+def build_spare_agent() -> "ChatAgent":
+    # built outside any session, so its completions would only count towards the shared trackers;
+    # get_agent gives it the session's own handler before it is used
+    from thevoid.usage import AdmittedCompletionHandler, BufferedCompletionTracker
+
+    return build_agent(
+        AdmittedCompletionHandler(
+            logger=logger,
+            openai_client=get_openai_client(),
+            bedrock_runtime_client=get_bedrock_client(),
+            debug_output_prompt_and_response=False,
+            completion_tracker=BufferedCompletionTracker(get_usage_accumulator()),
+        )
+    )
+
+
+def seed_agent(agent: "ChatAgent", image_description: str):
+    from supersullytools.llm.agent import AgentStates
+
+    agent.force_add_chat_msg(
+        msg=(
+            "User description follows, respond as if the user had said to you "
+            '"Mirror mirror on the wall, who\'s the fairest of them all"\n\n'
+            f"<user_description>{image_description}</user_description>"
+        ),
+        role="system",
+    )
+    agent.current_state = AgentStates.received_message
+
+
+@st.cache_resource
+def get_conversation_context() -> ConversationContext:
+    return ConversationContext(
+        max_tokens=int(os.environ.get("MIRROR_CONTEXT_TOKENS", 2000)),
+        keep_recent=int(os.environ.get("MIRROR_CONTEXT_KEEP_RECENT", 6)),
+    )
+
+
+def compact_history(agent: "ChatAgent"):
+    # summarized on the agent runner between turns, so neither this run of the script nor the guest's
+    # next message waits on it (unless they reply before the summary is back)
+    get_agent_runner().run_between_turns(
+        agent, partial(_compact_history, get_conversation_context(), agent, get_session_usage_tracker())
+    )
+
+
+def _compact_history(context: ConversationContext, agent: "ChatAgent", usage: "SessionUsageTracking"):
+    # runs off the script thread; compaction only ever saves tokens, so no failure of it should reach the guest
+    try:
+        context.compact(agent)
+    except BusyError:
+        logger.info("LLM calls are backed up, leaving chat history compaction for the next turn")
+    except Exception:
+        logger.warning("Chat history compaction failed, leaving the history as it is", exc_info=True)
+    logger.debug(f"Conversation context {context.stats(agent, usage)}")
+
+
+@st.cache_resource
+def get_agent_runner() -> AgentRunner:
+    return AgentRunner()
+
+
+def run_agent(agent: "ChatAgent") -> bool:
+    # the agent runs on the runner's worker pool; the script just relays status until it goes idle;
+    # returns whether the turn completed
+    status = st.empty()
+    try:
+        for msg in get_agent_runner().submit(agent).iter_updates():
+            status.caption(msg)
+    except BusyError:
+        # the agent is left mid-turn, so the next rerun picks it back up
+        logger.warning("LLM calls are backed up, agent turn not admitted", exc_info=True)
+        return False
+    finally:
+        status.empty()
+    return True
+
+
+def reset_guest():
+    st.session_state.cam_input = None
+    reset_agent()
+
+
+def stop_busy(container=st):
+    # the guest's turn (or photo) wasn't admitted; the history doesn't end in a reply to show, so
+    # stop here, leaving a way to retry (the agent picks its turn back up on the rerun) or start over
+    container.warning("The mirror is busy right now; give it a moment and try again")
+    container.button("Try again", use_container_width=True, type="primary")
+    container.button("Reset", on_click=reset_guest, use_container_width=True)
+    st.stop()
+
+
+@st.cache_resource
+def get_vision_hedger() -> Hedger:
+    return Hedger()
+
+
+@st.cache_resource
+def get_description_cache() -> DescriptionCache:
+    return DescriptionCache(
+        ttl_seconds=float(os.environ.get("MIRROR_PHOTO_CACHE_TTL", 1800)),
+        match_distance=int(os.environ.get("MIRROR_PHOTO_MATCH_DISTANCE", 8)),
+        hint_distance=int(os.environ.get("MIRROR_PHOTO_HINT_DISTANCE", 24)),
+    )
+
+
+def prepare_photo(image) -> PreparedImage:
+    return prepare_image(
+        image.getvalue(),
+        max_side=int(os.environ.get("MIRROR_IMAGE_MAX_SIDE", 768)),
+    )
+
+
+def get_photo_description(image) -> str:
+    return describe_photo_cached(
+        get_description_cache(),
+        get_vision_hedger(),
+        get_agent(),
+        prepare_photo(image),
+        # hedging can double the cost of a description, so it's the first thing to go
+        hedge=not get_budget().over_soft_limit,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_tts() -> SentenceTTS:
+    cache = AudioCache(
+        max_bytes=int(float(os.environ.get("TTS_CACHE_MB", 64)) * 1024 * 1024),
+        persist_dir=os.environ.get("TTS_CACHE_DIR"),
+    )
+    fallback = os.environ.get("TTS_FALLBACK_ENGINE", "espeak")
+    return SentenceTTS(
+        engine=get_engine(os.environ.get("TTS_ENGINE", "gtts")),
+        fallback=get_engine(fallback) if fallback else None,
+        timeout_seconds=float(os.environ.get("TTS_TIMEOUT_SECONDS", 5)),
+        cache=cache,
+    )
+
+
+def get_audio(text: str) -> tuple[Optional[bytes], Optional[str]]:
+    # sentences are synthesized concurrently, so this takes about as long as the slowest sentence;
+    # the raw bytes come straight out of the audio cache and are handed to st.audio as-is
+    with get_metrics().span("audio"):
+        try:
+            return get_tts().synthesize(text)
+        except Exception:
+            # the reply is already on screen; better silent than a broken page
+            logger.exception("Speech synthesis failed, showing the reply without audio")
+            return None, None
+
+
+def warm_bedrock():
+    from botocore.exceptions import ClientError
+
+    try:
+        get_bedrock_client().converse(
+            modelId="warm-up", messages=[{"role": "user", "content": [{"text": "Mirror mirror"}]}]
+        )
+    except ClientError:
+        # turned away (and not billed) for the unknown model, but the connection is open by then
+        pass
+
+
+def warm_up():
+    # called on every run; the steps themselves only run in the background, see Warmup
+    get_warmup().register(
+        {
+            # the first of these also does the mirror's heavy imports
+            "usage trackers": lambda: get_usage_accumulator().refresh(),
+            "bedrock": warm_bedrock,
+            "openai": lambda: get_openai_client().models.list(),
+            "spare agent": lambda: get_agent_pool().ensure_spare(build_spare_agent),
+            "tts": lambda: wait(get_tts().prewarm(STOCK_PHRASES)),
+        }
+    )
+
+
+def display_usage():
+    for tracker in get_trackers():
+        st.write(tracker.__class__.__name__)
+        tracker.render_completion_cost_as_expander()
+    st.json(get_budget().stats())
+
+
+def get_agent_utils(agent: "ChatAgent", extra_slash_cmds: Optional[dict[str, "SlashCmd"]] = None) -> "ChatAgentUtils":
+    from supersullytools.streamlit.chat_agent_utils import ChatAgentUtils, SlashCmd
+
+    return ChatAgentUtils(
+        agent,
+        use_system_slash_cmds=False,
+        extra_slash_cmds={
+            "/usage": SlashCmd(
+                name="Show Usage",
+                mechanism=display_usage,
+                description="Display LLM Usage",
+            ),
+            "/agents": SlashCmd(
+                name="Show Agents",
+                mechanism=lambda: get_agent_pool().stats(),
+                description="Display agent pool occupancy",
+            ),
+            "/queue": SlashCmd(
+                name="Show LLM Queue",
+                mechanism=lambda: get_admission_controller().stats(),
+                description="Display LLM calls in flight and waiting",
+            ),
+            "/metrics": SlashCmd(
+                name="Show Metrics",
+                mechanism=lambda: get_metrics().stats(),
+                description="Display how long each stage takes, in seconds",
+            ),
+            "/warmup": SlashCmd(
+                name="Show Warm-up",
+                mechanism=lambda: get_warmup().stats(),
+                description="Display how long warming up took, per step",
+            ),
+            "/context": SlashCmd(
+                name="Show Context",
+                mechanism=lambda: get_conversation_context().stats(agent, get_session_usage_tracker()),
+                description="Display chat history size and prompt cache hit rate",
+            ),
+            **(extra_slash_cmds or {}),
+        },
+    )
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from typing import TYPE_CHECKING, Optional
+
+from logzero import logger
+from PIL import Image, ImageOps
+
+from thevoid.metrics import percentile
+from thevoid.vision import dhash, hash_distance
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+
+
+def frame_hash(raw: bytes) -> int:
+    # cheap enough to run on every live frame; jpeg frames are decoded at reduced size via draft mode
+    image = Image.open(BytesIO(raw))
+    image.draft("L", (128, 128))
+    return dhash(ImageOps.exif_transpose(image))
+
+
+class PresenceDetector(object):
+    """Watches live camera frames for a subject who has stepped in front of the mirror and is holding still.
+
+    The scene is compared against a learned background: the first settled scene, replaced whenever the
+    view stays unchanged for `background_seconds`. That first scene may well have a guest in it, so it is
+    only trusted once it has held still for `confirm_seconds`; until then nobody is reported present, and
+    a different settled scene (say, the empty room once the guest walks off) takes its place. Scenes that
+    look like a guest's photo (see `subject_seen`) are never taken for the background. A subject is
+    "stable" once `stable_frames` consecutive frames are within `motion_distance` bits of each other and at
+    least `presence_distance` bits away from a trusted background.
+    """
+
+    def __init__(
+        self,
+        stable_frames: int = 3,
+        motion_distance: int = 12,
+        presence_distance: int = 32,
+        background_seconds: float = 120,
+        confirm_seconds: float = 10,
+    ):
+        self.stable_frames = stable_frames
+        self.motion_distance = motion_distance
+        self.presence_distance = presence_distance
+        self.background_seconds = background_seconds
+        self.confirm_seconds = confirm_seconds
+        self.background: Optional[int] = None
+        self.confirmed = False
+        self._subjects: deque[int] = deque(maxlen=8)
+        self.current: Optional[int] = None
+        self._streak = 0
+        self._settled_since: Optional[float] = None
+
+    def observe(self, phash: int) -> bool:
+        # returns True while a subject is present and stable
+        now = time.monotonic()
+        if self.current is not None and hash_distance(self.current, phash) <= self.motion_distance:
+            self._streak += 1
+        else:
+            self._streak = 1
+            self._settled_since = now
+        self.current = phash
+
+        if self._streak < self.stable_frames:
+            return False
+        settled_for = now - self._settled_since
+        changed = self.background is not None and hash_distance(self.background, phash) >= self.presence_distance
+        adopt = self.background is None or settled_for >= self.background_seconds or (changed and not self.confirmed)
+        if adopt and not self._is_subject(phash):
+            if self.background != phash:
+                logger.debug("Adopting settled scene as the mirror background")
+            self.background = phash
+            self.confirmed = settled_for >= self.confirm_seconds
+            return False
+        if not self.confirmed:
+            self.confirmed = self.background is not None and not changed and settled_for >= self.confirm_seconds
+            return False
+        return changed
+
+    def subject_seen(self, phash: int):
+        # a guest's photo; if the background looks like them, it was learned with them in it
+        self._subjects.append(phash)
+        if self.background is not None and self._is_subject(self.background):
+            logger.info("Mirror background had a guest in it, learning it again")
+            self.background = None
+            self.confirmed = False
+
+    def _is_subject(self, phash: int) -> bool:
+        return any(hash_distance(x, phash) < self.presence_distance for x in self._subjects)
+
+
+@dataclass
+class Speculation:
+    """A photo description and first agent turn started before the guest has asked for them."""
+
+    phash: int
+    agent: "ChatAgent"
+    future: Future
+    # checked by the speculating task between its steps, so a guest who has left doesn't get a paid first turn
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    started: float = field(default_factory=time.monotonic)
+
+    def matches(self, phash: int, max_distance: int) -> bool:
+        return hash_distance(self.phash, phash) <= max_distance
+
+    def cancel(self):
+        # a call already in flight can't be recalled, but nothing further is started; its result
+        # (and agent) are simply dropped
+        self.cancelled.set()
+        if self.future.cancel() or not self.future.done():
+            logger.info(f"Discarding speculative description after {time.monotonic() - self.started:.1f}s")
+
+
+@dataclass(frozen=True)
+class CaptureSettings:
+    # keyword arguments for camera_input_live
+    debounce: int
+    width: int
+    height: int
+
+
+IDLE_CAPTURE = CaptureSettings(debounce=2000, width=352, height=265)
+ACTIVE_CAPTURE = CaptureSettings(debounce=750, width=704, height=530)
+
+
+class CaptureController(object):
+    """Chooses the live camera's frame rate and resolution, and keeps frame throughput stats.
+
+    The feed runs at the active settings while there is motion or a guest in frame, and drops to the
+    idle settings once the scene has been empty and still for `idle_after_seconds`.
+    """
+
+    def __init__(
+        self,
+        idle: CaptureSettings = IDLE_CAPTURE,
+        active: CaptureSettings = ACTIVE_CAPTURE,
+        motion_distance: int = 12,
+        idle_after_seconds: float = 20,
+        window: int = 50,
+    ):
+        self.idle = idle
+        self.active = active
+        self.motion_distance = motion_distance
+        self.idle_after_seconds = idle_after_seconds
+        self.frames = 0
+        self._last_phash: Optional[int] = None
+        self._last_motion = time.monotonic()
+        self._subject_present = False
+        self._arrivals: deque[float] = deque(maxlen=window)
+        self._processing: deque[float] = deque(maxlen=window)
+
+    @property
+    def mode(self) -> str:
+        if self._subject_present or time.monotonic() - self._last_motion < self.idle_after_seconds:
+            return "active"
+        return "idle"
+
+    def settings(self) -> CaptureSettings:
+        return self.active if self.mode == "active" else self.idle
+
+    def record(self, phash: int, processing_seconds: float, subject_present: bool):
+        mode = self.mode
+        now = time.monotonic()
+        if self._last_phash is not None and hash_distance(self._last_phash, phash) > self.motion_distance:
+            self._last_motion = now
+        self._last_phash = phash
+        self._subject_present = subject_present
+        self.frames += 1
+        self._arrivals.append(now)
+        self._processing.append(processing_seconds)
+        if self.mode != mode:
+            logger.info(f"Live camera switching to {self.mode} capture {self.stats()}")
+
+    def stats(self) -> dict:
+        arrivals = list(self._arrivals)
+        processing_ms = [x * 1000 for x in self._processing]
+        elapsed = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else 0.0
+        return {
+            "mode": self.mode,
+            **asdict(self.settings()),
+            "frames": self.frames,
+            "fps": round((len(arrivals) - 1) / elapsed, 2) if elapsed else 0.0,
+            "processing_ms_p50": round(percentile(processing_ms, 50) or 0.0, 1),
+            "processing_ms_p95": round(percentile(processing_ms, 95) or 0.0, 1),
+        }
@@ -0,0 +1,364 @@
+"""Local stand-ins for the paid services the app talks to, so it can be benchmarked offline.
+
+`StubLLMServer` answers OpenAI chat completions (plain and streamed), OpenAI's model list and Bedrock
+`converse` calls with canned text, paced by a latency `Profile`; point the app at it with `stub_env`. `StubTTSEngine` and
+`StubMemory` replace gTTS and DynamoDB in-process.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote
+
+from logzero import logger
+from simplesingletable import DynamoDbMemory
+
+from thevoid.tts import ENGINES, TTSEngine
+
+# a tiny, well-formed svg, so the Void's svg response types pass validation
+STUB_SVG = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">'
+    '<circle cx="32" cy="32" r="16" fill="#222"/></svg>'
+)
+STUB_WORDS = (
+    "The mirror sees you and the void hears you. Your words drift out into the dark and come back softer. "
+    "You look wonderful tonight, truly radiant, and the whole party has noticed. Take a breath; you are "
+    "exactly where you need to be."
+).split()
+# rough token counts for prompt content the stub can't see into
+IMAGE_TOKENS = 1500
+
+
+@dataclass(frozen=True)
+class Profile:
+    # seconds before the first token; each call draws from a lognormal around this, spread by `jitter`
+    ttft_seconds: float = 0.5
+    jitter: float = 0.3
+    tokens_per_second: float = 60
+    # longest reply the stub gives, in tokens (words), whatever the request's max tokens
+    reply_tokens: int = 60
+    # fraction of calls answered with a 503 instead
+    error_rate: float = 0.0
+    dynamodb_seconds: float = 0.01
+    tts_seconds_per_char: float = 0.004
+
+    def ttft(self) -> float:
+        if not self.ttft_seconds:
+            return 0.0
+        return self.ttft_seconds * random.lognormvariate(0, self.jitter) if self.jitter else self.ttft_seconds
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+PROFILES: dict[str, Profile] = {
+    # no delays at all; measures the app's own overhead
+    "instant": Profile(ttft_seconds=0, jitter=0, tokens_per_second=0, dynamodb_seconds=0, tts_seconds_per_char=0),
+    "typical": Profile(),
+    "slow": Profile(ttft_seconds=2.0, jitter=0.5, tokens_per_second=20, dynamodb_seconds=0.05, tts_seconds_per_char=0.01),
+    "flaky": Profile(error_rate=0.1),
+}
+
+
+def reply_text(prompt: str, max_tokens: Optional[int], profile: Profile, offset: int = 0) -> list[str]:
+    # the reply as a list of tokens (words with their trailing space), shaped to what the prompt asks for;
+    # `offset` rotates the canned words so consecutive replies differ
+    if "SVG" in prompt:
+        return [STUB_SVG]
+    if "ALL CAPS" in prompt:
+        return ["STILL."]
+    count = min(profile.reply_tokens, max_tokens or profile.reply_tokens)
+    words = [STUB_WORDS[(offset + idx) % len(STUB_WORDS)] for idx in range(count)]
+    return [f"{word} " for word in words[:-1]] + [words[-1].rstrip(",;") + "."]
+
+
+def _openai_prompt(body: dict) -> tuple[str, int]:
+    text, tokens = [], 0
+    for msg in body.get("messages", []):
+        content = msg.get("content")
+        if isinstance(content, str):
+            text.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                text.append(part["text"])
+            else:
+                tokens += IMAGE_TOKENS
+    joined = "\n".join(text)
+    return joined, tokens + len(joined) // 4 + 1
+
+
+def _bedrock_prompt(body: dict) -> tuple[str, int]:
+    text, tokens = [], 0
+    for msg in body.get("messages", []):
+        for part in msg.get("content", []):
+            if "text" in part:
+                text.append(part["text"])
+            else:
+                tokens += IMAGE_TOKENS
+    joined = "\n".join(text)
+    return joined, tokens + len(joined) // 4 + 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubLLMServer"
+
+    def log_message(self, format, *args):
+        logger.debug(f"stub {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        # the warm-up lists models to open a connection
+        if self.path.rstrip("/").endswith("/models"):
+            self.server.count("openai models")
+            model = {"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "stub"}
+            self.send_json(200, {"object": "list", "data": [model]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            route = f"openai {body.get('model')}"
+        elif self.path.startswith("/model/") and self.path.endswith("/converse"):
+            route = f"bedrock {unquote(self.path[len('/model/') : -len('/converse')])}"
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        if route.startswith("bedrock") and "." not in route:
+            # like Bedrock itself, turn away model ids that aren't <provider>.<model>; the warm-up relies on it
+            self.server.count(f"{route} rejected")
+            self.send_json(
+                400,
+                {"message": "The provided model identifier is invalid."},
+                headers={"x-amzn-ErrorType": "ValidationException"},
+            )
+            return
+        offset = self.server.count(route)
+        profile = self.server.profile
+        if profile.error_rate and random.random() < profile.error_rate:
+            self.server.count(f"{route} error")
+            time.sleep(profile.ttft())
+            self.send_json(
+                503,
+                {"error": {"message": "stub overloaded", "type": "server_error"}, "message": "stub overloaded"},
+                headers={"x-amzn-ErrorType": "ServiceUnavailableException"},
+            )
+            return
+        if route.startswith("openai"):
+            self.openai_completion(body, offset)
+        else:
+            self.bedrock_converse(body, offset)
+
+    def openai_completion(self, body: dict, offset: int):
+        profile = self.server.profile
+        prompt, prompt_tokens = _openai_prompt(body)
+        tokens = reply_text(prompt, body.get("max_completion_tokens") or body.get("max_tokens"), profile, offset)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": 0},
+            "completion_tokens_details": {"reasoning_tokens": 0},
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": completion_id, "created": int(time.time()), "model": body.get("model")}
+        time.sleep(profile.ttft())
+        if not body.get("stream"):
+            time.sleep(profile.token_delay() * len(tokens))
+            message = {"role": "assistant", "content": "".join(tokens)}
+            self.send_json(
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop", "logprobs": None}],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for idx, token in enumerate(tokens):
+            if idx:
+                time.sleep(profile.token_delay())
+            delta = {"role": "assistant", "content": token} if not idx else {"content": token}
+            self.send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self.send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.send_event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def bedrock_converse(self, body: dict, offset: int):
+        profile = self.server.profile
+        prompt, prompt_tokens = _bedrock_prompt(body)
+        tokens = reply_text(prompt, (body.get("inferenceConfig") or {}).get("maxTokens"), profile, offset)
+        started = time.perf_counter()
+        time.sleep(profile.ttft() + profile.token_delay() * len(tokens))
+        self.send_json(
+            200,
+            {
+                "output": {"message": {"role": "assistant", "content": [{"text": "".join(tokens)}]}},
+                "stopReason": "end_turn",
+                "usage": {"inputTokens": prompt_tokens, "outputTokens": len(tokens), "totalTokens": prompt_tokens + len(tokens)},
+                "metrics": {"latencyMs": int((time.perf_counter() - started) * 1000)},
+            },
+        )
+
+    def send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event(self, payload: dict):
+        self.send_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """OpenAI / Bedrock look-alike on localhost; `port=0` picks a free port."""
+
+    daemon_threads = True
+
+    def __init__(self, profile: Profile, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), StubHandler)
+        self.profile = profile
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, route: str) -> int:
+        with self._lock:
+            self.requests[route] += 1
+            return sum(self.requests.values())
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.requests)
+
+
+def stub_env(url: str) -> dict[str, str]:
+    # environment that sends the app's OpenAI and Bedrock calls to the stub server
+    return {
+        "OPENAI_BASE_URL": f"{url}/v1",
+        "OPENAI_API_KEY": "stub",
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": url,
+        "AWS_ACCESS_KEY_ID": "stub",
+        "AWS_SECRET_ACCESS_KEY": "stub",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        # gpt vision calls are posted straight to api.openai.com, so only the Bedrock model can be stubbed
+        "VISION_MODELS": "Claude 3 Haiku",
+        "VISION_HEDGE_DELAY": "off",
+        "TTS_ENGINE": StubTTSEngine.name,
+        "TTS_FALLBACK_ENGINE": StubTTSEngine.name,
+        "DYNAMODB_TABLE": "stub",
+    }
+
+
+class StubTTSEngine(TTSEngine):
+    """Returns a few bytes of "audio" after a delay proportional to the text."""
+
+    name = "stub"
+    mime_type = "audio/mpeg"
+    seconds_per_char: float = 0.0
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        time.sleep(self.seconds_per_char * len(text))
+        return b"ID3" + text.encode()
+
+
+ENGINES[StubTTSEngine.name] = StubTTSEngine
+
+
+class StubMemory(DynamoDbMemory):
+    """DynamoDbMemory kept in a dict, with `latency_seconds` added to every read and write."""
+
+    latency_seconds: float = 0.0
+
+    def __init__(self, logger, table_name: str = "stub", **kwargs):
+        super().__init__(logger=logger, table_name=table_name, track_stats=False)
+        self.items: dict[tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+
+    def get_existing(self, existing_id, data_class, version=0, consistent_read=False):
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            item = self.items.get((data_class.__name__, existing_id))
+            return item.model_copy(deep=True) if item is not None else None
+
+    def increment_counter(self, existing_resource, field_name: str, incr_by: int = 1) -> int:
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            key = (type(existing_resource).__name__, existing_resource.resource_id)
+            item = self.items.setdefault(key, existing_resource.model_copy(deep=True))
+            if "." in field_name:
+                first_part, remainder = field_name.split(".", maxsplit=1)
+                counts = getattr(item, first_part) or {}
+                counts[remainder] = counts.get(remainder, 0) + incr_by
+                setattr(item, first_part, counts)
+                return counts[remainder]
+            setattr(item, field_name, (getattr(item, field_name) or 0) + incr_by)
+            return getattr(item, field_name)
+
+    def _put_nonversioned_resource(self, resource):
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            self.items[type(resource).__name__, resource.resource_id] = resource.model_copy(deep=True)
+        return resource
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub OpenAI / Bedrock endpoints for local runs")
+    parser.add_argument("--profile", default="typical", choices=sorted(PROFILES))
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = StubLLMServer(PROFILES[args.profile], port=args.port)
+    print("Point the app at the stub with:")
+    for name, value in stub_env(server.url).items():
+        if not name.startswith(("TTS_", "DYNAMODB_")):
+            print(f"  export {name}={value}")
+    print(f"Serving {args.profile!r} profile on {server.url}; ctrl-c to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
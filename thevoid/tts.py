@@ -0,0 +1,241 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Optional
+
+from logzero import logger
+
+from thevoid.cache import TTLCache, content_key
+from thevoid.metrics import get_metrics
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+CLAUSE_END_RE = re.compile(r"(?<=[,;:—])\s+")
+
+# extra phrases to synthesize ahead of time, separated by "|"
+STOCK_PHRASES = [x.strip() for x in os.environ.get("TTS_PREWARM_PHRASES", "").split("|") if x.strip()]
+
+
+class TTSEngine(object):
+    name: str = "base"
+    mime_type: str = "audio/mpeg"
+
+    def available(self) -> bool:
+        return True
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        raise NotImplementedError
+
+    def join(self, chunks: list[bytes]) -> bytes:
+        # MP3 frames play back-to-back when simply concatenated
+        return b"".join(chunks)
+
+
+class GTTSEngine(TTSEngine):
+    name = "gtts"
+    mime_type = "audio/mpeg"
+
+    def __init__(self, timeout_seconds: float = 10):
+        # per request; without one a dropped connection holds its worker thread indefinitely
+        self.timeout_seconds = timeout_seconds
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        from gtts import gTTS
+
+        sound_file = BytesIO()
+        gTTS(text, lang=lang, timeout=self.timeout_seconds).write_to_fp(sound_file)
+        return sound_file.getvalue()
+
+
+class EspeakEngine(TTSEngine):
+    """Offline synthesis with espeak-ng; every chunk runs in its own short-lived process."""
+
+    name = "espeak"
+    mime_type = "audio/wav"
+
+    def __init__(self, binary: Optional[str] = None, words_per_minute: int = 165):
+        self.binary = binary or shutil.which("espeak-ng") or shutil.which("espeak")
+        self.words_per_minute = words_per_minute
+
+    def available(self) -> bool:
+        return self.binary is not None
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        if not self.binary:
+            raise RuntimeError("espeak-ng is not installed")
+        result = subprocess.run(
+            [self.binary, "-v", lang, "-s", str(self.words_per_minute), "--stdout", text],
+            capture_output=True,
+            check=True,
+            timeout=30,
+        )
+        return result.stdout
+
+    def join(self, chunks: list[bytes]) -> bytes:
+        if len(chunks) == 1:
+            return chunks[0]
+        output = BytesIO()
+        with wave.open(output, "wb") as joined:
+            for idx, chunk in enumerate(chunks):
+                with wave.open(BytesIO(chunk), "rb") as part:
+                    if not idx:
+                        joined.setparams(part.getparams())
+                    joined.writeframes(part.readframes(part.getnframes()))
+        return output.getvalue()
+
+
+ENGINES: dict[str, type[TTSEngine]] = {
+    GTTSEngine.name: GTTSEngine,
+    EspeakEngine.name: EspeakEngine,
+}
+
+
+def get_engine(name: str) -> TTSEngine:
+    try:
+        return ENGINES[name.strip().lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown TTS engine {name=}; options are {', '.join(ENGINES)}") from None
+
+
+class AudioCache(TTLCache):
+    """Raw synthesized audio bytes keyed by (text, lang, engine), bounded by total size."""
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        persist_dir: Optional[str | Path] = None,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        super().__init__(
+            max_entries=10_000,
+            ttl_seconds=ttl_seconds,
+            persist_dir=persist_dir,
+            name="tts audio",
+            max_bytes=max_bytes,
+        )
+
+    @staticmethod
+    def key(text: str, lang: str, engine: str) -> str:
+        return content_key("tts", text, lang, engine)
+
+
+def split_sentences(text: str, min_chars: int = 40, max_chars: int = 200) -> list[str]:
+    # sentences make natural synthesis units; very short ones are merged so each request is worth
+    # its round trip, and very long ones are broken at clause boundaries
+    pieces = []
+    for sentence in SENTENCE_END_RE.split(text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        current = ""
+        for clause in CLAUSE_END_RE.split(sentence):
+            if current and len(current) + len(clause) + 1 > max_chars:
+                pieces.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}".strip()
+        if current:
+            pieces.append(current)
+
+    chunks = []
+    for piece in filter(None, (x.strip() for x in pieces)):
+        if chunks and len(chunks[-1]) < min_chars and len(chunks[-1]) + len(piece) + 1 <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class SentenceTTS(object):
+    """Synthesizes speech a sentence at a time, concurrently, delivering audio chunks in order.
+
+    If the primary engine fails or misses its deadline, the utterance is synthesized again with the
+    fallback engine, and the primary is skipped for a cooldown period. Each engine has its own worker
+    pool, so a fallback never queues behind primary calls that are still hanging; the last engine
+    tried gets `max_wait_seconds` before giving up.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[TTSEngine] = None,
+        fallback: Optional[TTSEngine] = None,
+        lang: str = "en",
+        cache: Optional[AudioCache] = None,
+        timeout_seconds: float = 5.0,
+        max_wait_seconds: float = 20.0,
+        cooldown_seconds: float = 60.0,
+        max_workers: int = 8,
+    ):
+        self.engine = engine or GTTSEngine()
+        self.fallback = None
+        if fallback is not None and fallback.available() and fallback.name != self.engine.name:
+            self.fallback = fallback
+        self.lang = lang
+        self.cache = cache
+        self.timeout_seconds = timeout_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._engine_down_until = 0.0
+        self._executors = {
+            x.name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"tts-{x.name}")
+            for x in (self.engine, self.fallback)
+            if x is not None
+        }
+        # pre-warming waits on chunk synthesis, so it can't share the chunk pool without risking starving it
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-warm")
+
+    def _submit(self, engine: TTSEngine, text: str) -> list[Future]:
+        executor = self._executors[engine.name]
+        return [executor.submit(engine.synthesize, x, self.lang) for x in split_sentences(text)]
+
+    def synthesize(self, text: str) -> tuple[bytes, str]:
+        # returns the audio along with its mime type, which depends on the engine that produced it
+        engines = [x for x in (self.engine, self.fallback) if x is not None]
+        if len(engines) > 1 and time.monotonic() < self._engine_down_until:
+            engines = engines[1:]
+
+        for engine in engines:
+            # the fallback's audio is only looked up once the primary is down, so a single failure
+            # doesn't have it standing in for the primary for as long as it stays cached
+            if self.cache is not None:
+                if (audio := self.cache.get(self.cache.key(text, self.lang, engine.name))) is not None:
+                    return audio, engine.mime_type
+            is_last = engine is engines[-1]
+            try:
+                audio = self._synthesize_with(
+                    engine, text, timeout=self.max_wait_seconds if is_last else self.timeout_seconds
+                )
+            except Exception:
+                if is_last:
+                    raise
+                logger.warning(f"TTS engine {engine.name} failed, falling back", exc_info=True)
+                self._engine_down_until = time.monotonic() + self.cooldown_seconds
+                continue
+            if self.cache is not None:
+                self.cache.set(self.cache.key(text, self.lang, engine.name), audio)
+            return audio, engine.mime_type
+
+    def _synthesize_with(self, engine: TTSEngine, text: str, timeout: float) -> bytes:
+        with get_metrics().span(f"tts {engine.name}"):
+            futures = self._submit(engine, text)
+            _, not_done = wait(futures, timeout=timeout)
+            if not_done:
+                for future in not_done:
+                    future.cancel()
+                raise TimeoutError(f"TTS engine {engine.name} took longer than {timeout}s")
+            return engine.join([x.result() for x in futures])
+
+    def prewarm(self, phrases: Iterable[str]) -> list[Future]:
+        # synthesize stock phrases in the background so their first use is a cache hit
+        def _warm(phrase: str):
+            try:
+                self.synthesize(phrase)
+            except Exception:
+                logger.warning(f"Failed pre-warming TTS phrase {phrase=}", exc_info=True)
+
+        return [self._background.submit(_warm, x) for x in phrases if x.strip()]
@@ -0,0 +1,214 @@
+import atexit
+import datetime
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Optional
+
+from logzero import logger
+from supersullytools.llm.completions import ALL_MODELS, CompletionHandler, CompletionResponse
+from supersullytools.llm.trackers import CompletionTracker, DailyUsageTracking, GlobalUsageTracker, UsageStats
+
+from thevoid.admission import AdmissionController, get_admission_controller
+from thevoid.budget import BudgetGuard, completion_cost, total_cost
+from thevoid.metrics import get_metrics
+
+if TYPE_CHECKING:
+    import openai
+    from simplesingletable import DynamoDbMemory, DynamoDbResource
+    from supersullytools.llm.completions import CompletionModel
+
+
+def _apply(stats: UsageStats, deltas: Counter):
+    for (field_name, llm), amount in deltas.items():
+        counts = getattr(stats, field_name)
+        counts[llm] = counts.get(llm, 0) + amount
+
+
+class UsageAccumulator(object):
+    """Keeps the global and daily usage trackers in memory, writing them back to DynamoDB in batches.
+
+    Completions are tallied in memory immediately, so the daily cost check never waits on DynamoDB; the
+    pending counter increments are coalesced and flushed by a background thread every
+    `flush_interval_seconds`, as soon as `max_pending` completions are waiting, and at interpreter exit.
+    A crash loses at most the completions tracked since the last flush (bounded by both of those).
+    The daily tracker is re-read every `refresh_seconds` to pick up usage from other processes, and
+    `budget` follows the daily tracker's total.
+    """
+
+    def __init__(
+        self,
+        memory: "DynamoDbMemory",
+        flush_interval_seconds: float = 10,
+        max_pending: int = 20,
+        refresh_seconds: float = 300,
+        budget: Optional[BudgetGuard] = None,
+    ):
+        self.memory = memory
+        self.budget = budget or BudgetGuard()
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending = max_pending
+        self.refresh_seconds = refresh_seconds
+        self.flushes = 0
+        self.flush_failures = 0
+        self.writes = 0
+        self.global_tracker = GlobalUsageTracker.ensure_exists(memory)
+        self._daily = DailyUsageTracking.get_for_today(memory)
+        self.budget.reset(total_cost(self._daily))
+        self._day = datetime.date.today()
+        self._refreshed_at = time.monotonic()
+        # (tracker type, resource id) -> (tracker, pending increments keyed by (field, llm))
+        self._pending: dict[tuple[str, str], tuple["DynamoDbResource", Counter]] = {}
+        self._pending_completions = 0
+        self._lock = threading.Lock()
+        # serializes flushes between the background thread and explicit flush() calls
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def today(self) -> DailyUsageTracking:
+        with self._lock:
+            if datetime.date.today() == self._day:
+                return self._daily
+        # first look after midnight; anything still pending for yesterday keeps its own tracker
+        daily = DailyUsageTracking.get_for_today(self.memory)
+        with self._lock:
+            if datetime.date.today() != self._day:
+                self._daily, self._day = daily, datetime.date.today()
+                self.budget.reset(total_cost(daily))
+                self._refreshed_at = time.monotonic()
+            return self._daily
+
+    def track_completion(self, model: "CompletionModel", completion: "CompletionResponse"):
+        deltas = Counter(
+            {
+                ("completions_by_model", model.llm): 1,
+                ("input_tokens_by_model", model.llm): completion.input_tokens,
+                ("output_tokens_by_model", model.llm): completion.output_tokens,
+            }
+        )
+        if completion.cached_input_tokens:
+            deltas["cached_input_tokens_by_model", model.llm] = completion.cached_input_tokens
+        daily = self.today()
+        with self._lock:
+            for tracker in (self.global_tracker, daily):
+                _apply(tracker, deltas)
+                key = (type(tracker).__name__, tracker.resource_id)
+                self._pending.setdefault(key, (tracker, Counter()))[1].update(deltas)
+            self._pending_completions += 1
+            self.budget.add(completion_cost(model, completion))
+            if self._pending_completions >= self.max_pending:
+                self._wake.set()
+
+    def track_openai_usage(self, model_id: str, usage: "openai.types.CompletionUsage"):
+        # for completions made with the openai client directly (the Void page) rather than through a
+        # CompletionHandler; priced and counted the same way
+        model = next((x for x in ALL_MODELS if x.llm_id == model_id), None)
+        if model is None:
+            logger.warning(f"No pricing for {model_id=}, its usage isn't tracked")
+            return
+        cached = usage.prompt_tokens_details.cached_tokens if usage.prompt_tokens_details else 0
+        completion = CompletionResponse(
+            content="",
+            input_tokens=usage.prompt_tokens,
+            cached_input_tokens=cached or 0,
+            output_tokens=usage.completion_tokens,
+            llm_metadata=model,
+            generated_at=datetime.datetime.now(datetime.timezone.utc),
+            stop_reason="",
+            completion_time_ms=0,
+        )
+        self.track_completion(model, completion)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                completions, self._pending_completions = self._pending_completions, 0
+            if not pending:
+                return
+            failed: dict[tuple[str, str], tuple["DynamoDbResource", Counter]] = {}
+            with get_metrics().span("usage flush"):
+                for key, (tracker, deltas) in pending.items():
+                    for (field_name, llm), amount in deltas.items():
+                        try:
+                            self.memory.increment_counter(tracker, f"{field_name}.{llm}", amount)
+                            self.writes += 1
+                        except Exception:
+                            logger.warning(f"Failed flushing usage {key=} {field_name=} {llm=}", exc_info=True)
+                            failed.setdefault(key, (tracker, Counter()))[1][field_name, llm] += amount
+            self.flushes += 1
+            if failed:
+                # put the unwritten increments back; they go out with the next flush
+                self.flush_failures += 1
+                with self._lock:
+                    for key, (tracker, deltas) in failed.items():
+                        self._pending.setdefault(key, (tracker, Counter()))[1].update(deltas)
+                    self._pending_completions += completions
+            logger.debug(f"Flushed usage for {completions} completions {self.stats()}")
+
+    def refresh(self):
+        # re-read today's totals so the cost check sees other processes' usage; our own pending
+        # increments aren't in DynamoDB yet, so they are layered back on top
+        # (holding the flush lock, so nothing can be written between the read and the swap)
+        with self._flush_lock, get_metrics().span("usage refresh"):
+            daily = DailyUsageTracking.get_for_today(self.memory)
+            with self._lock:
+                if daily.resource_id == self._daily.resource_id:
+                    if (pending := self._pending.get((type(daily).__name__, daily.resource_id))) is not None:
+                        _apply(daily, pending[1])
+                    self._daily = daily
+                    self.budget.reset(total_cost(daily))
+                self._refreshed_at = time.monotonic()
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_completions": self._pending_completions,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "writes": self.writes,
+        }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._refreshed_at > self.refresh_seconds:
+                    self.refresh()
+            except Exception:
+                logger.exception("Usage flush failed")
+
+
+class BufferedCompletionTracker(CompletionTracker):
+    """CompletionTracker that hands the DynamoDB-backed counters to a UsageAccumulator rather than
+    writing them inline; any in-memory trackers (e.g. the session tracker) are updated as usual."""
+
+    def __init__(self, accumulator: UsageAccumulator, trackers: Optional[list[UsageStats]] = None):
+        super().__init__(memory=accumulator.memory, trackers=list(trackers or []))
+        self.accumulator = accumulator
+
+    def track_completion(self, model, prompt, completion):
+        super().track_completion(model, prompt, completion)
+        self.accumulator.track_completion(model, completion)
+
+
+class AdmittedCompletionHandler(CompletionHandler):
+    """CompletionHandler whose completions all go through the process-wide AdmissionController."""
+
+    def __init__(self, *args, admission: Optional[AdmissionController] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.admission = admission or get_admission_controller()
+
+    def get_completion(self, *args, **kwargs):
+        with self.admission.slot():
+            return super().get_completion(*args, **kwargs)
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from base64 import b64encode
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import TYPE_CHECKING, Literal, Optional
+
+from logzero import logger
+from PIL import Image, ImageOps
+
+from thevoid.hedging import Hedger
+from thevoid.metrics import get_metrics
+
+if TYPE_CHECKING:
+    from supersullytools.llm.agent import ChatAgent
+
+DESCRIBE_PHOTO_PROMPT = (
+    "You are part of a magic mirror AI system at a party; a user has just stepped up to "
+    'your physical device and pressed the button to initiate a new "session"; provide a brief '
+    "description of the user in the attached photo which will be given to the magic mirror chatbot AI "
+    "as it chats with the user in the role of a magic mirror. Do not try to read text on shirts or things like "
+    "that, you are bad at it and it often steers the interaction into a poor conversation. Do make your description "
+    "as detailed as possible, noting where possible the style of haircut, if they are stylish, etc. "
+    "Any specific and notable details that can be used by the chatbot greatly enhance the user experience!"
+)
+
+# the first model is the primary; the rest are only asked if it is slow (see VISION_HEDGE_DELAY)
+VISION_MODELS = [x.strip() for x in os.environ.get("VISION_MODELS", "Claude 3 Haiku,GPT 4 Omni Mini").split(",")]
+DEFAULT_HEDGE_DELAY = 4.0
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    image_format: Literal["jpeg", "png"]
+    width: int
+    height: int
+    original_bytes: int
+    encode_ms: float
+    # perceptual hash of the prepared frame; see dhash
+    phash: int = 0
+
+    @property
+    def b64(self) -> str:
+        return b64encode(self.data).decode()
+
+    def stats(self) -> dict:
+        return {
+            "original_bytes": self.original_bytes,
+            "prepared_bytes": len(self.data),
+            "size": f"{self.width}x{self.height}",
+            "encode_ms": round(self.encode_ms, 1),
+        }
+
+
+def dhash(image: Image.Image, hash_size: int = 16) -> int:
+    # difference hash: one bit per horizontally adjacent pair of pixels in a tiny grayscale thumbnail;
+    # robust to re-encoding and small lighting changes, so frames of the same scene land a few bits apart
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            offset = row * (hash_size + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def hash_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def prepare_image(
+    raw: bytes,
+    max_side: int = 768,
+    crop_aspect: Optional[float] = 1.0,
+    quality: int = 80,
+) -> PreparedImage:
+    # the vision models get nothing extra out of full-size camera frames, so trim the frame down to
+    # the (centered) subject, shrink it to a useful resolution, and re-encode as a compact jpeg
+    started = time.perf_counter()
+    image = ImageOps.exif_transpose(Image.open(BytesIO(raw))).convert("RGB")
+
+    if crop_aspect:
+        width, height = image.size
+        if width / height > crop_aspect:
+            new_width = round(height * crop_aspect)
+            left = (width - new_width) // 2
+            image = image.crop((left, 0, left + new_width, height))
+        else:
+            new_height = round(width / crop_aspect)
+            top = (height - new_height) // 2
+            image = image.crop((0, top, width, top + new_height))
+
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    prepared = PreparedImage(
+        data=output.getvalue(),
+        image_format="jpeg",
+        width=image.width,
+        height=image.height,
+        original_bytes=len(raw),
+        encode_ms=(time.perf_counter() - started) * 1000,
+        phash=dhash(image),
+    )
+    logger.info(f"Prepared photo for vision model {prepared.stats()}")
+    return prepared
+
+
+def describe_photo(
+    agent: "ChatAgent",
+    image: PreparedImage,
+    model_name: str = "Claude 3 Haiku",
+    hint: Optional[str] = None,
+) -> str:
+    from supersullytools.llm.completions import ImagePromptMessage
+
+    prompt = DESCRIBE_PHOTO_PROMPT
+    if hint:
+        prompt += (
+            "\n\nThis is probably a guest who visited the mirror a little while ago; this is how they were "
+            f"described then:\n\n<previous_description>{hint}</previous_description>\n\n"
+            "Reuse what still applies and correct anything that has changed in the photo."
+        )
+    completion = agent.get_simple_completion(
+        msg=ImagePromptMessage(
+            content=prompt,
+            images=[image.b64],
+            image_formats=[image.image_format],
+        ),
+        model=agent.completion_handler.get_model_by_name_or_id(model_name),
+    )
+    return completion.content
+
+
+def get_hedge_delay(hedger: Hedger, primary: str) -> Optional[float]:
+    # VISION_HEDGE_DELAY is a number of seconds, "off", or "auto" to hedge at the primary's observed p95
+    setting = os.environ.get("VISION_HEDGE_DELAY", "auto").strip().lower()
+    if setting == "off":
+        return None
+    if setting == "auto":
+        suggested = hedger.suggest_delay(primary)
+        return suggested if suggested is not None else DEFAULT_HEDGE_DELAY
+    return float(setting)
+
+
+def describe_photo_hedged(
+    hedger: Hedger, agent: "ChatAgent", image: PreparedImage, hint: Optional[str] = None, hedge: bool = True
+) -> str:
+    delay = get_hedge_delay(hedger, VISION_MODELS[0]) if hedge else None
+    winner, description = hedger.call(
+        {model: (lambda m=model: describe_photo(agent, image, m, hint)) for model in VISION_MODELS},
+        delay_seconds=delay,
+    )
+    logger.info(f"Photo described by {winner=} {delay=} latencies={hedger.latencies.stats()}")
+    return description
+
+
+class DescriptionCache(object):
+    """Recent photo descriptions, looked up by perceptual hash distance rather than exact key.
+
+    Frames within `match_distance` bits of a cached one reuse its description outright; frames within
+    `hint_distance` bits get a fresh description, with the old one supplied as a hint.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 64,
+        ttl_seconds: float = 1800,
+        match_distance: int = 8,
+        hint_distance: int = 24,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.match_distance = match_distance
+        self.hint_distance = hint_distance
+        self.hits = 0
+        self.hints = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, phash: int) -> tuple[Optional[str], Optional[str]]:
+        # returns (description to reuse, description to use as a hint); at most one is set
+        with self._lock:
+            cutoff = time.monotonic() - self.ttl_seconds
+            for key in [k for k, (stored_at, _) in self._entries.items() if stored_at < cutoff]:
+                del self._entries[key]
+            best = min(self._entries, key=lambda x: hash_distance(x, phash), default=None)
+            distance = hash_distance(best, phash) if best is not None else None
+            if distance is not None and distance <= self.match_distance:
+                self.hits += 1
+                self._entries.move_to_end(best)
+                return self._entries[best][1], None
+            if distance is not None and distance <= self.hint_distance:
+                self.hints += 1
+                return None, self._entries[best][1]
+            self.misses += 1
+            return None, None
+
+    def add(self, phash: int, description: str):
+        with self._lock:
+            self._entries[phash] = (time.monotonic(), description)
+            self._entries.move_to_end(phash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "hints": self.hints, "misses": self.misses}
+
+
+def describe_photo_cached(
+    cache: DescriptionCache, hedger: Hedger, agent: "ChatAgent", image: PreparedImage, hedge: bool = True
+) -> str:
+    reuse, hint = cache.lookup(image.phash)
+    if reuse is not None:
+        logger.info(f"Reusing cached photo description {cache.stats()}")
+        return reuse
+    phash = image.phash
+    if hint is not None:
+        # a likely returning guest; the refresh only needs a small frame since the hint carries the detail
+        image = prepare_image(image.data, max_side=384, crop_aspect=None)
+    with get_metrics().span("photo description"):
+        description = describe_photo_hedged(hedger, agent, image, hint, hedge)
+    cache.add(phash, description)
+    return description
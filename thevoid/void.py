@@ -0,0 +1,201 @@
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+from xml.etree import ElementTree
+
+import openai
+from logzero import logger
+
+from thevoid.cache import content_key
+from thevoid.llm import LLMClient
+from thevoid.metrics import get_metrics
+
+SVG_R = r"(?:<\?xml\b[^>]*>[^<]*)?(?:<!--.*?-->[^<]*)*(?:<svg|<!DOCTYPE svg)\b"
+SVG_RE = re.compile(SVG_R, re.DOTALL)
+FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*\n(.*?)\n?```$", re.DOTALL)
+
+EMPATHIC_MODEL = "gpt-4o-mini"
+
+
+def is_svg(text: str) -> bool:
+    return SVG_RE.match(text) is not None
+
+
+def is_well_formed_svg(text: str) -> bool:
+    if not is_svg(text):
+        return False
+    try:
+        ElementTree.fromstring(text.encode())
+    except ElementTree.ParseError:
+        return False
+    return True
+
+
+def is_single_caps_word(text: str) -> bool:
+    return re.fullmatch(r"[A-Z][A-Z'\-]*[.!]?", text) is not None
+
+
+@dataclass(frozen=True)
+class ResponseType:
+    description: str
+    max_tokens: int
+    weight: int = 1
+    temperature: float = 1.0
+    model: str = "gpt-4o-mini"
+    stop: Optional[list[str]] = None
+    validator: Optional[Callable[[str], bool]] = field(default=None, compare=False)
+    # how many extra attempts to make when the validator rejects a response
+    retries: int = 1
+
+    def is_valid(self, text: str) -> bool:
+        return self.validator is None or self.validator(text)
+
+
+RESPONSE_TYPES: list[ResponseType] = [
+    ResponseType(
+        "A single word in ALL CAPS representing the mood.",
+        max_tokens=10,
+        weight=2,
+        stop=["\n"],
+        validator=is_single_caps_word,
+    ),
+    ResponseType("A simple poem.", max_tokens=200),
+    ResponseType("A simple haiku.", max_tokens=60),
+    ResponseType(
+        'An SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, with some animation perhaps; do not include backticks or other markdown elements around the svg output).',
+        max_tokens=1000,
+        validator=is_well_formed_svg,
+    ),
+    ResponseType(
+        'An SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, do not include backticks or other markdown elements around the svg output).',
+        max_tokens=800,
+        validator=is_well_formed_svg,
+    ),
+    ResponseType(
+        'An abstract SVG graphic (starting with <?xml version="1.0" encoding="UTF-8"?>\n<svg>, do not include backticks or other markdown elements around the svg output).',
+        max_tokens=800,
+        validator=is_well_formed_svg,
+    ),
+    ResponseType("ASCII art reflecting the emotion.", max_tokens=400),
+    # ResponseType("A color or color palette (provide hex codes) symbolizing the mood.", max_tokens=60),
+    ResponseType(
+        "A brief metaphorical statement capturing the essence of the feelings.",
+        max_tokens=60,
+    ),
+    ResponseType("A brief story or anecdote mirroring the emotions.", max_tokens=250),
+    ResponseType(
+        "A sequence of emojis representing the user's feelings.",
+        max_tokens=30,
+        weight=3,
+        stop=["\n\n"],
+    ),
+    # ResponseType("An abstract mathematical expression related to the emotions.", max_tokens=60),
+    ResponseType("A suggestion for a mindfulness or breathing exercise.", max_tokens=200),
+    ResponseType("A completely freeform response of your choosing.", max_tokens=400),
+]
+
+
+def choose_response_type() -> ResponseType:
+    return random.choices(RESPONSE_TYPES, weights=[x.weight for x in RESPONSE_TYPES])[0]
+
+
+def normalize_input(user_input: str) -> str:
+    # fold case, whitespace and trailing punctuation so near-identical submissions share cache entries
+    return " ".join(user_input.lower().split()).strip(" .!?")
+
+
+def empathic_cache_key(user_input: str) -> str:
+    return content_key("empathic", normalize_input(user_input))
+
+
+def abstract_cache_key(user_input: str, response_type: ResponseType) -> str:
+    return content_key("abstract", normalize_input(user_input), response_type.description)
+
+
+def make_empathic_prompt(user_input: str) -> str:
+    return f"""
+            You are a compassionate and understanding listener. A user is venting their feelings:
+
+            "{user_input}"
+
+            Provide a CONCISE but empathetic and supportive response. Never offer advice or try to solve the problem.
+            """.strip()
+
+
+def make_abstract_prompt(user_input: str, response_type: ResponseType, empathic: Optional[str] = None) -> str:
+    if empathic:
+        # only splice the empathic response in when it has already been generated
+        empathic_block = f"""
+And empathic response has been generated and displayed to the user already:
+
+<empathic_response>
+{empathic}
+</empathic_response>
+
+Generate a new, small, abstract response that carries a similar sentiment.
+""".strip()
+    else:
+        empathic_block = "Generate a small, abstract response that reflects the sentiment of their words."
+
+    return f"""
+You are THE VOID. An Abstract Feelings AI.
+
+A user is venting their feelings
+
+<input>
+{user_input}
+</input>
+
+{empathic_block}
+
+For this response, please generate a response of the following type:
+{response_type.description}
+
+Do not include any titles or headers. Output only the response.
+""".strip()
+
+
+def stream_empathic(client: LLMClient, user_input: str) -> Iterator[str]:
+    # yield the text deltas as they arrive so the page can render them immediately
+    return get_metrics().stream(
+        "void empathic",
+        client.stream_chat(
+            model=EMPATHIC_MODEL,
+            messages=[{"role": "user", "content": make_empathic_prompt(user_input)}],
+            max_tokens=150,
+            n=1,
+            temperature=0.7,
+        ),
+    )
+
+
+def clean_abstract(text: str) -> str:
+    text = text.strip()
+    if match := FENCE_RE.match(text):
+        # the model sometimes wraps svg / ascii art in markdown fences despite being asked not to
+        text = match.group(1).strip()
+    return text
+
+
+def get_abstract(
+    client: LLMClient, user_input: str, response_type: ResponseType, empathic: Optional[str] = None
+) -> str:
+    prompt = make_abstract_prompt(user_input, response_type, empathic)
+    abstract = ""
+    with get_metrics().span("void abstract"):
+        for attempt in range(1 + response_type.retries):
+            response = client.chat(
+                model=response_type.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_completion_tokens=response_type.max_tokens,
+                n=1,
+                # retries are made a little more conservative to improve the odds of a valid response
+                temperature=response_type.temperature if not attempt else min(response_type.temperature, 0.7),
+                stop=response_type.stop or openai.NOT_GIVEN,
+            )
+            abstract = clean_abstract(response.choices[0].message.content or "")
+            if response_type.is_valid(abstract):
+                break
+            logger.warning(f"Abstract response failed validation {attempt=} {response_type.description=}")
+    return abstract
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from functools import cache
+from typing import Callable, Optional
+
+from logzero import logger
+
+from thevoid.metrics import get_metrics
+
+
+class Warmup(object):
+    """Does the slow once-per-process work (imports, connections, loading trackers, building agents)
+    in the background, so the first guest after a restart doesn't wait on it.
+
+    Pages hand over their steps with `register` on every run; each step runs once, in the order
+    registered, as soon as it is first seen. Pooled connections are closed after sitting idle for a
+    while, so once nothing has registered for `idle_seconds` every step is run again, and keeps being
+    re-run at that interval for up to `max_idle_seconds`. Past that the app is left to go cold, and
+    the steps are run once more when the next page registers. Steps should be cheap to repeat.
+    """
+
+    def __init__(
+        self, idle_seconds: Optional[float] = 50, max_idle_seconds: Optional[float] = 600, enabled: bool = True
+    ):
+        self.idle_seconds = idle_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self.enabled = enabled
+        self.runs = 0
+        self.errors = 0
+        # seconds from the first registration until its steps were all done
+        self.first_seconds: Optional[float] = None
+        self.last_seconds: dict[str, float] = {}
+        self._steps: dict[str, Callable[[], object]] = {}
+        self._done: set[str] = set()
+        self._started_at: Optional[float] = None
+        self._last_active = time.monotonic()
+        # set once the idle re-warms have stopped; the next registration sets _resumed in its place
+        self._dormant = False
+        self._resumed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+
+    def register(self, steps: dict[str, Callable[[], object]]):
+        # also counts as activity, putting off the next idle re-warm
+        if not self.enabled:
+            return
+        with self._lock:
+            self._last_active = time.monotonic()
+            resumed, self._dormant = self._dormant, False
+            self._resumed = self._resumed or resumed
+            new = [name for name in steps if name not in self._steps]
+            for name in new:
+                self._steps[name] = steps[name]
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+                self._thread.start()
+        if new or resumed:
+            self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = [name for name in self._steps if name not in self._done]
+            idle = time.monotonic() - self._last_active
+        return {
+            "steps": {name: round(seconds, 3) for name, seconds in self.last_seconds.items()},
+            "pending": pending,
+            "first_seconds": round(self.first_seconds, 3) if self.first_seconds is not None else None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "idle_seconds": round(idle, 1),
+            "dormant": self._dormant,
+        }
+
+    def _run_step(self, name: str):
+        started = time.perf_counter()
+        try:
+            with get_metrics().span(f"warm-up {name}"):
+                self._steps[name]()
+        except Exception:
+            self.errors += 1
+            logger.warning(f"Warm-up step {name} failed", exc_info=True)
+        self.last_seconds[name] = time.perf_counter() - started
+
+    def _run(self):
+        while True:
+            with self._lock:
+                names = list(self._steps)
+                pending = [name for name in names if name not in self._done]
+                # whatever was kept warm before going dormant has likely gone cold since
+                resumed = self._resumed and not pending
+                if resumed:
+                    self._resumed = False
+                idle_for = time.monotonic() - self._last_active
+                idle = self.idle_seconds and idle_for >= self.idle_seconds
+                if idle and self.max_idle_seconds is not None and idle_for >= self.max_idle_seconds:
+                    # nobody has been around for a while; stop keeping connections open for them
+                    if not self._dormant:
+                        logger.info(f"No activity for {idle_for:.0f}s, pausing idle re-warms")
+                    idle, self._dormant = False, True
+            if pending:
+                started = time.perf_counter()
+                for name in pending:
+                    self._run_step(name)
+                    with self._lock:
+                        self._done.add(name)
+                if self.first_seconds is None:
+                    # how long a guest arriving with the first page load could have been kept waiting
+                    self.first_seconds = time.monotonic() - self._started_at
+                steps = {name: round(self.last_seconds[name], 3) for name in pending}
+                logger.info(f"Warm-up took {time.perf_counter() - started:.2f}s {steps}")
+                self.runs += 1
+            elif idle or resumed:
+                started = time.perf_counter()
+                for name in names:
+                    self._run_step(name)
+                reason = "as activity resumed" if resumed else f"after {self.idle_seconds:g}s idle"
+                logger.info(f"Re-warmed {reason} in {time.perf_counter() - started:.2f}s")
+                self.runs += 1
+            self._wake.wait(None if self._dormant else self.idle_seconds or None)
+            self._wake.clear()
+
+
+@cache
+def get_warmup() -> Warmup:
+    # a single instance for the whole process, shared by every page and session
+    idle_seconds = float(os.environ.get("WARMUP_IDLE_SECONDS", 50))
+    max_idle_seconds = float(os.environ.get("WARMUP_MAX_IDLE_SECONDS", 600))
+    return Warmup(
+        idle_seconds=idle_seconds or None,
+        max_idle_seconds=max_idle_seconds or None,
+        enabled=os.environ.get("WARMUP", "1") != "0",
+    )